@@ -0,0 +1,125 @@
+# app/artifacts.py
+"""
+Almacén de PDFs ya generados, direccionado por contenido.
+
+La llave es un sha256 de (plantilla, mtime de la plantilla, mapping): si la
+orden o la plantilla cambian, la llave cambia y el PDF viejo simplemente deja
+de usarse. Así no hace falta invalidar nada y cualquier réplica de la misma
+máquina puede reutilizar lo que otra generó.
+
+Los PDFs que genera el pre-render (app/prerender.py) llevan una marca
+`<llave>.warm` al lado, para medir cuántas descargas se sirvieron ya
+calientes (warm_hit_ratio).
+
+Configuración por entorno:
+  ARTIFACTS_DIR        directorio de los PDFs (por defecto, en el tmp del sistema)
+  ARTIFACTS_MAX_FILES  tope de archivos; al pasarlo se borran los menos usados
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR") or os.path.join(tempfile.gettempdir(), "mtcolectivo-artifacts")
+ARTIFACTS_MAX_FILES = int(os.getenv("ARTIFACTS_MAX_FILES", "5000"))
+
+# cada cuántos put() se revisa el tope de archivos
+_PRUNE_EVERY = 100
+
+
+def artifact_key(template, mapping: dict) -> str:
+    """`template` es un CompiledTemplate del registro."""
+    payload = json.dumps([template.name, template.mtime, mapping], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = self.misses = self.stored = self.warm_hits = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def _warm_marker(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.warm")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> str | None:
+        """Ruta del PDF si existe (y lo marca como usado); None si no."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if os.path.exists(self._warm_marker(key)):
+            self.warm_hits += 1
+        return path
+
+    def put(self, key: str, pdf_path: str, warmed: bool = False) -> str:
+        """
+        Copia el PDF al almacén; el reemplazo es atómico para las demás réplicas.
+        warmed=True: lo generó el pre-render, no una petición.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        dest = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(pdf_path, tmp)
+            os.replace(tmp, dest)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if warmed:
+            open(self._warm_marker(key), "a").close()
+        with self._lock:
+            self.stored += 1
+            self._puts += 1
+            prune = self._puts % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return dest
+
+    def prune(self) -> int:
+        """Borra los PDFs menos usados hasta quedar en max_files."""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".pdf")]
+        except FileNotFoundError:
+            return 0
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return 0
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for e in entries[:excess]:
+            for path in (e.path, e.path[:-4] + ".warm"):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass  # otra réplica ya lo borró (o no venía del pre-render)
+        return excess
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "warm_hits": self.warm_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            # fracción de descargas que el pre-render dejó listas de antemano
+            "warm_hit_ratio": round(self.warm_hits / lookups, 4) if lookups else None,
+        }
+
+
+artifacts = ArtifactStore(ARTIFACTS_DIR, ARTIFACTS_MAX_FILES)
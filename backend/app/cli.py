@@ -0,0 +1,225 @@
+# app/cli.py
+"""
+Herramienta offline (sin HTTP ni JWT) para trabajo por lotes.
+
+Uso (desde backend/):
+  python -m app.cli render --ids 12,15,40-80 --out reimpresiones/
+  python -m app.cli render --desde 2026-11-01 --hasta 2026-11-30 --out noviembre/ --workers 4
+  python -m app.cli import ordenes.xlsx --sheet Orden
+  python -m app.cli import ordenes.csv --batch 1000
+
+Ambos comandos guardan un checkpoint: si se interrumpen, la siguiente
+corrida con los mismos argumentos continúa donde se quedó (--no-resume para
+empezar de cero).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.crud import fecha_until, order_as_dict, order_from_mapping
+from app.database import SessionLocal, engine
+from app.main_utils import HeaderPlan, apply_totals_frame, mapping_from_data
+from app.migrations import run_migrations
+from app.models import Order
+from app.shared_state import file_lock
+from app.templates import registry
+
+
+class Progress:
+    def __init__(self, total: int, label: str):
+        self.total, self.label = total, label
+        self.done = self.errors = 0
+        self.t0 = time.monotonic()
+
+    def step(self, ok: bool = True, n: int = 1) -> None:
+        self.done += n
+        if not ok:
+            self.errors += n
+        rate = self.done / max(time.monotonic() - self.t0, 1e-6)
+        print(f"\r{self.label}: {self.done}/{self.total}  errores={self.errors}  {rate:.1f}/s", end="", flush=True)
+
+    def finish(self) -> None:
+        print(f"\n{self.label}: {self.done - self.errors} ok, {self.errors} con error en {time.monotonic() - self.t0:.1f}s")
+
+
+def parse_ids(spec: str) -> list[int]:
+    """'1,4,10-12' -> [1, 4, 10, 11, 12]"""
+    ids = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            ids.extend(range(int(a), int(b) + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+# -------------------------- RENDER --------------------------
+def _render_one(order_id: int, mapping: dict, template: str, out_dir: str) -> str:
+    # corre en un worker: usa la plantilla ya compilada de ese proceso
+    return registry.get(template).render_pdf(mapping, os.path.join(out_dir, f"orden_{order_id}.pdf"))
+
+
+def load_done(checkpoint: str) -> set[int]:
+    done = set()
+    if os.path.exists(checkpoint):
+        with open(checkpoint, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # línea truncada por una interrupción
+                if entry.get("ok"):
+                    done.add(entry["id"])
+    return done
+
+
+def cmd_render(args) -> int:
+    tpl = registry.get(args.template)
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint = args.checkpoint or os.path.join(args.out, ".render-checkpoint.jsonl")
+    if not args.resume and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    done = load_done(checkpoint)
+
+    db = SessionLocal()
+    try:
+        q = db.query(Order)
+        if args.ids:
+            q = q.filter(Order.id.in_(parse_ids(args.ids)))
+        if args.desde:
+            q = q.filter(Order.fecha >= args.desde)
+        if args.hasta:
+            q = q.filter(fecha_until(args.hasta))
+        jobs = [
+            (o.id, mapping_from_data(order_as_dict(o), tpl.tokens))
+            for o in q.order_by(Order.id).all()
+            if o.id not in done
+        ]
+    finally:
+        db.close()
+
+    if done:
+        print(f"checkpoint: {len(done)} órdenes ya renderizadas, se omiten")
+    if not jobs:
+        print("nada que renderizar")
+        return 0
+
+    progress = Progress(len(jobs), "render")
+    with open(checkpoint, "a", encoding="utf-8") as ck, ProcessPoolExecutor(max_workers=args.workers) as ex:
+        futures = {ex.submit(_render_one, oid, mapping, tpl.name, args.out): oid for oid, mapping in jobs}
+        for fut in as_completed(futures):
+            oid = futures[fut]
+            try:
+                path = fut.result()
+                entry = {"id": oid, "ok": True, "path": path}
+            except Exception as e:
+                entry = {"id": oid, "ok": False, "error": str(e)[:500]}
+            ck.write(json.dumps(entry) + "\n")
+            ck.flush()
+            progress.step(entry["ok"])
+    progress.finish()
+    return 1 if progress.errors else 0
+
+
+# -------------------------- IMPORT --------------------------
+def read_table(path: str, sheet: str | None):
+    import pandas as pd
+
+    if path.lower().endswith(".csv"):
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    return pd.read_excel(path, sheet_name=sheet or 0, dtype=str)
+
+
+def cmd_import(args) -> int:
+    checkpoint = args.checkpoint or args.file + ".import-checkpoint.json"
+    start = 0
+    if args.resume and os.path.exists(checkpoint):
+        with open(checkpoint, encoding="utf-8") as f:
+            start = json.load(f).get("next_row", 0)
+        print(f"checkpoint: se continúa desde la fila {start}")
+
+    df = read_table(args.file, args.sheet)
+
+    # encabezados resueltos una sola vez; los problemas se ven antes de importar
+    plan = HeaderPlan(df.columns)
+    for label, items in (("desconocidos", plan.unknown), ("sin columna", plan.missing)):
+        if items:
+            print(f"encabezados {label}: {', '.join(map(str, items))}")
+    for token, headers in plan.duplicates.items():
+        print(f"encabezados duplicados para {token}: {', '.join(map(str, headers))} (gana el primero con valor)")
+    if args.strict and (plan.unknown or plan.duplicates or plan.missing):
+        print("--strict: se cancela la importación")
+        return 2
+
+    # limpieza y totales por columna completa, no celda por celda
+    frame = plan.frame(df.iloc[start:])
+    totals = apply_totals_frame(frame)
+    mappings = frame.to_dict("records")
+    numbers = totals.to_dict("records")
+
+    progress = Progress(len(df) - start, "import")
+    db = SessionLocal()
+    try:
+        for offset in range(0, len(mappings), args.batch):
+            chunk_start = start + offset
+            chunk = mappings[offset:offset + args.batch]
+            orders = [order_from_mapping(m, t) for m, t in zip(chunk, numbers[offset:offset + args.batch])]
+            if not args.dry_run:
+                db.add_all(orders)
+                db.commit()
+                # el checkpoint se escribe después del commit: un lote nunca se importa dos veces
+                with open(checkpoint, "w", encoding="utf-8") as f:
+                    json.dump({"file": os.path.abspath(args.file), "next_row": chunk_start + len(chunk)}, f)
+            progress.step(n=len(chunk))
+    finally:
+        db.close()
+    progress.finish()
+    if not args.dry_run and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("render", help="PDFs de órdenes existentes")
+    p.add_argument("--ids", help="ids o rangos: 1,4,10-20")
+    p.add_argument("--desde", help="fecha mínima (YYYY-MM-DD)")
+    p.add_argument("--hasta", help="fecha máxima (YYYY-MM-DD)")
+    p.add_argument("--out", required=True, help="directorio de salida")
+    p.add_argument("--template", help="plantilla del registro (por defecto: orden)")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--checkpoint")
+    p.add_argument("--no-resume", dest="resume", action="store_false")
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser("import", help="importa un Excel/CSV a orders")
+    p.add_argument("file")
+    p.add_argument("--sheet")
+    p.add_argument("--batch", type=int, default=500, help="filas por commit")
+    p.add_argument("--checkpoint")
+    p.add_argument("--no-resume", dest="resume", action="store_false")
+    p.add_argument("--dry-run", action="store_true", help="valida sin escribir en la base")
+    p.add_argument("--strict", action="store_true", help="cancela si hay encabezados desconocidos, duplicados o faltantes")
+    p.set_defaults(func=cmd_import)
+
+    args = parser.parse_args(argv)
+    if args.command == "render" and not (args.ids or args.desde or args.hasta):
+        parser.error("render necesita --ids, --desde o --hasta")
+
+    with file_lock("startup"):
+        run_migrations(engine)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
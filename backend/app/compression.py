@@ -0,0 +1,126 @@
+# app/compression.py
+"""
+Compresión de respuestas con negociación gzip / brotli.
+
+Sólo se comprimen tipos de texto (JSON, HTML, CSV...) de al menos
+COMPRESS_MIN_SIZE bytes: los PDF ya vienen comprimidos y en respuestas
+pequeñas la cabecera de gzip pesa más de lo que ahorra. Brotli se usa si el
+paquete `brotli` está instalado y el cliente lo acepta; si no, gzip.
+
+Configuración por entorno:
+  COMPRESS_MIN_SIZE        bytes mínimos para comprimir (por defecto 1024)
+  COMPRESS_GZIP_LEVEL      1-9 (por defecto 6)
+  COMPRESS_BROTLI_QUALITY  0-11 (por defecto 5: con el listado de órdenes ya gana a
+                           gzip 6 en bytes con el mismo CPU; de 6 en adelante se encarece)
+"""
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se negocia sólo gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """'br' o 'gzip' según Accept-Encoding (respeta q=0); None si no acepta ninguna."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = None
+    for enc in candidates:
+        q = accepted.get(enc, wildcard)
+        if q > 0 and (best is None or q > best[1]):
+            best = (enc, q)
+    return best[0] if best else None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+            self.compress, self._finish = self._c.process, self._c.finish
+        else:
+            self._c = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = contenedor gzip
+            self.compress, self._finish = self._c.compress, self._c.flush
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """Middleware ASGI puro; respuestas en streaming se comprimen por bloques."""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = next((v.decode("latin-1") for k, v in scope.get("headers", ()) if k == b"accept-encoding"), "")
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor: _Compressor | None = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message   # se envía junto con el primer bloque
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                if not more and len(body) < self.minimum_size:
+                    # respuesta completa y chica: va tal cual
+                    await send(_with_headers(start, vary=True))
+                    await send(message)
+                    passthrough = True
+                    return
+                compressor = _Compressor(encoding)
+                await send(_with_headers(start, vary=True, encoding=encoding))
+            chunk = compressor.compress(body)
+            if not more:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _with_headers(start: dict, vary: bool = False, encoding: str | None = None) -> dict:
+    headers = [(k, v) for k, v in start.get("headers", []) if not (encoding and k.lower() == b"content-length")]
+    if vary:
+        headers.append((b"vary", b"Accept-Encoding"))
+    if encoding:
+        headers.append((b"content-encoding", encoding.encode("latin-1")))
+    return {**start, "headers": headers}
@@ -1,9 +1,65 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from . import models
+from .main_utils import parse_time
 
 def create_order(db: Session, data: dict):
     obj = models.Order(**data)
     db.add(obj)
     db.commit()
     db.refresh(obj)
-    return obj
\ No newline at end of file
+    return obj
+
+def order_from_mapping(mapping: dict, totals: dict) -> models.Order:
+    """Orden a partir del mapping de la plantilla y los números de apply_totals."""
+    return models.Order(
+        nombre=mapping.get("&NOMBRE&"),
+        fecha=mapping.get("&FECHA&"),
+        dir_salida=mapping.get("&DIR_SALIDA&"),
+        dir_destino=mapping.get("&DIR_DESTINO&"),
+        hor_ida=mapping.get("&HOR_IDA&"),
+        hor_regreso=mapping.get("&HOR_REGRESO&"),
+        duracion=mapping.get("&DURACION&"),
+        capacidadu=mapping.get("&CAPACIDADU&"),
+        subtotal=totals["subtotal"],
+        descuento=totals["descuento"],
+        total=totals["total"],          # total final ya con descuento
+        abonado=totals["abonado"],
+        fecha_abono=mapping.get("&FECHA_ABONO&"),
+        liquidar=totals["liquidar"],
+    )
+
+def order_as_dict(order: models.Order) -> dict:
+    """Columnas crudas de la orden (entrada de mapping_from_data)."""
+    return {c.name: getattr(order, c.name) for c in models.Order.__table__.columns}
+
+# `fecha` es texto libre: las órdenes importadas de Excel (pandas con dtype=str)
+# la guardan como "2026-11-01 00:00:00", así que se compara por prefijo.
+def fecha_on(fecha: str):
+    """Órdenes de ese día, con o sin hora."""
+    return models.Order.fecha.startswith(fecha, autoescape=True)
+
+def fecha_until(hasta: str):
+    """fecha <= hasta, incluyendo las de ese mismo día que traen hora."""
+    return or_(models.Order.fecha <= hasta, fecha_on(hasta))
+
+def orders_for_batch(db: Session, ids: list[int] | None = None, fecha: str | None = None) -> list[models.Order]:
+    """Órdenes por lista de ids (en ese orden) o por fecha de viaje (por hora de ida)."""
+    q = db.query(models.Order)
+    if ids:
+        by_id = {o.id: o for o in q.filter(models.Order.id.in_(ids)).all()}
+        return [by_id[i] for i in dict.fromkeys(ids) if i in by_id]
+    if fecha:
+        return sorted(q.filter(fecha_on(fecha)).all(), key=trip_order)
+    return []
+
+def trip_order(order: models.Order) -> tuple:
+    """
+    Llave de orden por hora de ida real: hor_ida es texto libre ("9:00 am",
+    "13:00", "2:15 pm"...), así que ordenarlo como texto pone las 10:30 antes
+    de las 9:00. Las horas que parse_time no entiende van al final; id desempata.
+    """
+    try:
+        return (0, parse_time(order.hor_ida).time(), order.id)
+    except (ValueError, TypeError):
+        return (1, None, order.id)
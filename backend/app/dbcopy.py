@@ -0,0 +1,114 @@
+# app/dbcopy.py
+"""
+Copia en streaming de una base a otra (p. ej. app.db -> PostgreSQL).
+
+Uso (desde backend/):
+  python -m app.dbcopy --source sqlite:///./app.db \\
+                       --target postgresql+psycopg://mt:mt@localhost:5432/mtcolectivo
+
+Crea el esquema en el destino con las mismas migraciones del arranque, lee
+cada tabla por lotes (sin cargarla completa en memoria) y la inserta por
+lotes en una transacción por tabla. En PostgreSQL ajusta las secuencias al
+final para que los próximos INSERT no choquen con los ids copiados.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import Float, Integer, DateTime, column, create_engine, func, inspect, select, text
+from sqlalchemy import table as sql_table
+
+from app.database import Base, engine_kwargs
+from app.migrations import run_migrations
+
+
+def _coerce(col, value):
+    """Bases viejas de SQLite guardaron números y fechas como texto."""
+    if value is None:
+        return None
+    if isinstance(col.type, Float) and not isinstance(value, float):
+        try:
+            return float(str(value).replace(",", ""))
+        except ValueError:
+            return None
+    if isinstance(col.type, Integer) and not isinstance(value, int):
+        try:
+            return int(float(value))
+        except ValueError:
+            return None
+    if isinstance(col.type, DateTime) and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return value
+
+
+def copy_table(src, dst, table, batch: int, truncate: bool) -> int:
+    src_cols = {c["name"] for c in inspect(src).get_columns(table.name)}
+    cols = [c for c in table.columns if c.name in src_cols]
+    # columnas sin tipo: se leen los valores crudos, sin depender de los tipos de la base vieja
+    raw = sql_table(table.name, *[column(c.name) for c in cols])
+    query = select(*raw.c)
+
+    copied = 0
+    t0 = time.monotonic()
+    with src.connect().execution_options(stream_results=True, yield_per=batch) as sconn, dst.begin() as dconn:
+        if truncate:
+            dconn.execute(table.delete())
+        result = sconn.execute(query)
+        for rows in result.partitions(batch):
+            dconn.execute(table.insert(), [
+                {c.name: _coerce(c, v) for c, v in zip(cols, row)} for row in rows
+            ])
+            copied += len(rows)
+            print(f"\r  {table.name}: {copied} filas ({copied / max(time.monotonic() - t0, 1e-6):.0f}/s)", end="", flush=True)
+    print(f"\r  {table.name}: {copied} filas en {time.monotonic() - t0:.1f}s" + " " * 20)
+    return copied
+
+
+def reset_sequences(dst) -> None:
+    if dst.dialect.name != "postgresql":
+        return
+    with dst.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for col in table.primary_key.columns:
+                if isinstance(col.type, Integer) and col.autoincrement in (True, "auto"):
+                    max_id = conn.execute(select(func.max(col))).scalar()
+                    conn.execute(
+                        text("SELECT setval(pg_get_serial_sequence(:t, :c), :v, :called)"),
+                        {"t": table.name, "c": col.name, "v": max_id or 1, "called": max_id is not None},
+                    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.dbcopy", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="URL de la base origen")
+    parser.add_argument("--target", required=True, help="URL de la base destino")
+    parser.add_argument("--batch", type=int, default=1000, help="filas por lote")
+    parser.add_argument("--truncate", action="store_true", help="vacía las tablas destino antes de copiar")
+    args = parser.parse_args(argv)
+
+    src = create_engine(args.source, **engine_kwargs(args.source))
+    dst = create_engine(args.target, **engine_kwargs(args.target))
+
+    applied = run_migrations(dst)
+    for stmt in applied:
+        print(f"  migración: {stmt}")
+
+    total = 0
+    src_tables = set(inspect(src).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in src_tables:
+            print(f"  {table.name}: no existe en el origen, se omite")
+            continue
+        total += copy_table(src, dst, table, args.batch, args.truncate)
+    reset_sequences(dst)
+    print(f"listo: {total} filas copiadas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
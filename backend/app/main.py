@@ -1,7 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text
-from app.database import Base, engine
+from app.database import engine
+from app.migrations import run_migrations
+from app.templates import registry
+from app.render_pool import pipeline
+from app.prerender import prerender, PRERENDER_ENABLED
+from app.shared_state import file_lock
+from app.tracing import TracingMiddleware
+from app.compression import CompressionMiddleware
 from app.routers import pdf, orders, auth
 from app.routers.orders import public_router, private_router
 
@@ -13,37 +19,23 @@ app = FastAPI(
 )
 
 @app.on_event("startup")
-@app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine)
-
-    # mini-migración para columnas que pudieron faltar
-    with engine.connect() as conn:
-        rows = conn.execute(text("PRAGMA table_info('orders')")).fetchall()
-        cols = [row[1] for row in rows]
-
-        # nombre_columna: tipo_sqlite
-        needed_cols = {
-            "dir_salida": "TEXT",
-            "dir_destino": "TEXT",
-            "hor_ida": "TEXT",
-            "hor_regreso": "TEXT",
-            "duracion": "TEXT",
-            "capacidadu": "TEXT",
-            "subtotal": "REAL",
-            "descuento": "REAL",
-            "total": "REAL",
-            "abonado": "REAL",
-            "fecha_abono": "TEXT",
-            "liquidar": "REAL",
-            "created_at": "TEXT"
-        }
+async def on_startup():
+    # con varios workers, sólo uno a la vez crea tablas / migra columnas
+    with file_lock("startup"):
+        run_migrations(engine)
 
-        for col_name, col_type in needed_cols.items():
-            if col_name not in cols:
-                conn.execute(text(f"ALTER TABLE orders ADD COLUMN {col_name} {col_type}"))
+    # compila las plantillas DOCX antes de atender peticiones
+    registry.refresh()
+    pipeline.start()
+    # pre-calienta los PDFs de los próximos viajes en los ratos libres
+    if PRERENDER_ENABLED:
+        prerender.start()
 
-        conn.commit()
+@app.on_event("shutdown")
+async def on_shutdown():
+    # termina los PDFs en vuelo antes de cerrar el pool de procesos
+    await prerender.stop()
+    await pipeline.shutdown()
 
 # =======================
 # ROUTERS
@@ -64,6 +56,16 @@ app.include_router(private_router)
 # 🔐 PRIVADO: Panel administrativo protegido con JWT
 app.include_router(orders.private_router)
 
+# =======================
+# COMPRESIÓN (gzip / br para JSON y texto; los PDF pasan tal cual)
+# =======================
+app.add_middleware(CompressionMiddleware)
+
+# =======================
+# TRAZAS (Server-Timing + /pdf/traces)
+# =======================
+app.add_middleware(TracingMiddleware)
+
 # =======================
 # CORS
 # =======================
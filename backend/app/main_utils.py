@@ -1,50 +1,98 @@
 from io import BytesIO
-from zipfile import ZipFile, ZIP_DEFLATED
+from copy import copy
+from functools import lru_cache
+from multiprocessing.util import Finalize
+from pathlib import Path
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import numpy as np
 import pandas as pd
 import subprocess
+import logging
 import tempfile
+import shutil
 import os
 import re
+from datetime import datetime
 
-# Ruta de plantilla DOCX
-TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "PlantillaOrden.docx")
+from app.tracing import annotate, span
+
+logger = logging.getLogger(__name__)
 
 # -------------------------- DOCX UTILITIES --------------------------
-def rebuild_docx(original_bytes: bytes, updated_xml: bytes, path="word/document.xml") -> bytes:
-    in_buf = BytesIO(original_bytes)
+def docx_prefix(original_bytes: bytes, path: str = "word/document.xml") -> tuple[bytes, ZipInfo]:
+    """
+    Construye un ZIP con todos los miembros excepto `path`, ya comprimidos.
+    Devuelve ese prefijo y el ZipInfo original de `path` para volver a
+    escribirlo al final. Las plantillas del registro lo arman una sola vez
+    (CompiledTemplate.prefix) y lo pasan a rebuild_docx*.
+    """
     out_buf = BytesIO()
-    with ZipFile(in_buf, "r") as zin, ZipFile(out_buf, "w", compression=ZIP_DEFLATED) as zout:
+    target = None
+    with ZipFile(BytesIO(original_bytes), "r") as zin, ZipFile(out_buf, "w", compression=ZIP_DEFLATED) as zout:
         for item in zin.infolist():
-            data = zin.read(item.filename)
             if item.filename == path:
-                data = updated_xml
-            zout.writestr(item, data)
+                target = item
+                continue
+            zout.writestr(item, zin.read(item.filename))
+    if target is None:
+        raise KeyError(f"La plantilla no contiene {path}")
+    return out_buf.getvalue(), target
+
+def rebuild_docx(original_bytes: bytes, updated_xml: bytes, path="word/document.xml",
+                 prefix: tuple[bytes, ZipInfo] | None = None) -> bytes:
+    # Los miembros sin cambios (fuentes, imágenes, estilos...) se copian tal cual
+    # desde el prefijo ya comprimido; sólo se comprime el XML sustituido.
+    head, target = prefix or docx_prefix(original_bytes, path)
+    out_buf = BytesIO(head)
+    with ZipFile(out_buf, "a", compression=ZIP_DEFLATED) as zout:
+        zout.writestr(copy(target), updated_xml)
     return out_buf.getvalue()
 
-def tolerant_replace(xml: str, mapping: dict) -> str:
+def rebuild_docx_to_file(original_bytes: bytes, updated_xml: bytes, dest_path: str, path="word/document.xml",
+                         prefix: tuple[bytes, ZipInfo] | None = None) -> str:
+    # Igual que rebuild_docx, pero escribe directo a disco sin armar el DOCX en memoria
+    head, target = prefix or docx_prefix(original_bytes, path)
+    with open(dest_path, "wb") as f:
+        f.write(head)
+    with ZipFile(dest_path, "a", compression=ZIP_DEFLATED) as zout:
+        zout.writestr(copy(target), updated_xml)
+    return dest_path
+
+def _make_crossrun_pattern(token_key: str) -> re.Pattern:
+    core = token_key.strip("&")
+    return re.compile(
+        rf"&amp;\s*</w:t>\s*(?:</w:r>\s*<w:r[^>]*>\s*(?:<w:rPr>.*?</w:rPr>\s*)?)?<w:t[^>]*>\s*{re.escape(core)}\s*&amp;",
+        re.DOTALL | re.IGNORECASE,
+    )
+
+def _make_trailing_amp_pattern(token_key: str) -> re.Pattern:
+    core = token_key.strip("&")
+    return re.compile(
+        rf"&amp;{re.escape(core)}\s*</w:t>\s*(?:</w:r>\s*<w:r[^>]*>\s*(?:<w:rPr>.*?</w:rPr>\s*)?)?<w:t[^>]*>\s*&amp;",
+        re.DOTALL | re.IGNORECASE,
+    )
+
+def compile_token_patterns(tokens) -> dict:
+    """
+    Precompila, por token, los patrones que detectan tokens partidos entre runs.
+    Las plantillas del registro los compilan una sola vez al cargarse.
+    """
+    return {t: (_make_crossrun_pattern(t), _make_trailing_amp_pattern(t)) for t in tokens}
+
+def tolerant_replace(xml: str, mapping: dict, patterns: dict | None = None) -> str:
     for k, v in mapping.items():
         k_xml = k.replace("&", "&amp;")
         xml = xml.replace(k_xml, v)
 
-    def make_crossrun_pattern(token_key: str):
-        core = token_key.strip("&")
-        return re.compile(
-            rf"&amp;\s*</w:t>\s*(?:</w:r>\s*<w:r[^>]*>\s*(?:<w:rPr>.*?</w:rPr>\s*)?)?<w:t[^>]*>\s*{re.escape(core)}\s*&amp;",
-            re.DOTALL | re.IGNORECASE,
-        )
+    if patterns is None:
+        patterns = {}
+    compiled = [patterns.get(k) or (_make_crossrun_pattern(k), _make_trailing_amp_pattern(k)) for k in mapping]
 
-    for k, v in mapping.items():
-        xml = re.sub(make_crossrun_pattern(k), v, xml)
-
-    def make_trailing_amp_pattern(token_key: str):
-        core = token_key.strip("&")
-        return re.compile(
-            rf"&amp;{re.escape(core)}\s*</w:t>\s*(?:</w:r>\s*<w:r[^>]*>\s*(?:<w:rPr>.*?</w:rPr>\s*)?)?<w:t[^>]*>\s*&amp;",
-            re.DOTALL | re.IGNORECASE,
-        )
+    for (crossrun, _), v in zip(compiled, mapping.values()):
+        xml = crossrun.sub(v, xml)
 
-    for k, v in mapping.items():
-        xml = re.sub(make_trailing_amp_pattern(k), v, xml)
+    for (_, trailing), v in zip(compiled, mapping.values()):
+        xml = trailing.sub(v, xml)
 
     return xml
 
@@ -54,27 +102,113 @@ def fill_docx_with_mapping(template_bytes: bytes, mapping: dict) -> bytes:
     xml_new = tolerant_replace(xml, mapping)
     return rebuild_docx(template_bytes, xml_new.encode("utf-8"))
 
+_body_open_re = re.compile(r"<w:body[^>]*>")
+PAGE_BREAK_XML = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+def merge_document_xml(parts: list[str]) -> str:
+    """
+    Une varios document.xml rellenados de la MISMA plantilla en uno solo:
+    el cuerpo de cada parte va seguido de un salto de página y se conserva
+    el <w:sectPr> final (tamaño de hoja, márgenes, encabezado) de la primera.
+    """
+    if not parts:
+        raise ValueError("No hay documentos que unir")
+    first = parts[0]
+    head_end = _body_open_re.search(first).end()
+    tail_start = first.rfind("<w:sectPr")
+    if tail_start < head_end:
+        tail_start = first.rfind("</w:body>")
+    bodies = []
+    for xml in parts:
+        start = _body_open_re.search(xml).end()
+        end = xml.rfind("<w:sectPr")
+        if end < start:
+            end = xml.rfind("</w:body>")
+        bodies.append(xml[start:end])
+    return first[:head_end] + PAGE_BREAK_XML.join(bodies) + first[tail_start:]
+
+def concat_pdfs(paths: list[str], dest_path: str) -> str:
+    """Concatena PDFs ya generados sin volver a renderizarlos."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(dest_path, "wb") as f:
+        writer.write(f)
+    return dest_path
+
+# Perfiles de LibreOffice: uno por proceso (dos soffice con el mismo perfil no
+# corren en paralelo), todos bajo el mismo directorio.
+LO_PROFILE_DIR = os.getenv("LO_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "mtcolectivo-lo-profiles")
+_lo_profile: tuple[int, str] | None = None
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def lo_profile() -> str:
+    """
+    Perfil de LibreOffice de este proceso. Se crea al primer uso y se borra
+    cuando el proceso termina (workers del pool, CLI, uvicorn); los que dejó
+    un proceso muerto a la fuerza se barren al crear el siguiente.
+    """
+    global _lo_profile
+    pid = os.getpid()
+    if _lo_profile is None or _lo_profile[0] != pid:   # != pid: hijo de un fork
+        os.makedirs(LO_PROFILE_DIR, exist_ok=True)
+        if os.name == "posix":
+            for entry in os.scandir(LO_PROFILE_DIR):
+                owner = entry.name.rpartition("-")[2]
+                if owner.isdigit() and not _pid_alive(int(owner)):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        path = os.path.join(LO_PROFILE_DIR, f"lo-profile-{pid}")
+        # Finalize corre al salir tanto en el proceso principal como en los
+        # hijos de multiprocessing (atexit no corre en hijos de un fork)
+        Finalize(None, shutil.rmtree, args=(path,), kwargs={"ignore_errors": True}, exitpriority=0)
+        _lo_profile = (pid, path)
+    return _lo_profile[1]
+
+def convert_docx_to_pdf(docx_path: str) -> tuple[str, str]:
+    """
+    Convierte con LibreOffice y deja el PDF junto al DOCX.
+    Devuelve (ruta del PDF, salida de soffice): sus avisos sirven para diagnosticar
+    PDFs lentos o con fuentes sustituidas aunque la conversión no falle.
+    """
+    out_dir = os.path.dirname(docx_path)
+    cmd = [
+        "soffice", f"-env:UserInstallation={Path(lo_profile()).as_uri()}",
+        "--headless", "--nologo", "--nolockcheck",
+        "--convert-to", "pdf", "--outdir", out_dir, docx_path
+    ]
+    proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = (proc.stderr + proc.stdout).decode("utf-8", errors="ignore").strip()
+    return os.path.splitext(docx_path)[0] + ".pdf", output
+
+def docx_to_pdf_file(docx_path: str) -> str:
+    """Como convert_docx_to_pdf; la salida de soffice queda en la traza actual (si hay)."""
+    with span("convert"):
+        pdf_path, output = convert_docx_to_pdf(docx_path)
+        annotate("convert", soffice=output)
+    return pdf_path
+
 def docx_to_pdf_bytes(docx_bytes: bytes) -> bytes:
     with tempfile.TemporaryDirectory() as td:
         in_path = os.path.join(td, "tmp.docx")
-        out_dir = td
         with open(in_path, "wb") as f:
             f.write(docx_bytes)
-        cmd = [
-            "soffice", "--headless", "--nologo", "--nolockcheck",
-            "--convert-to", "pdf", "--outdir", out_dir, in_path
-        ]
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        pdf_path = os.path.join(out_dir, "tmp.pdf")
-        with open(pdf_path, "rb") as f:
+        with open(docx_to_pdf_file(in_path), "rb") as f:
             return f.read()
 
-def generate_pdf_from_template(mapping: dict) -> bytes:
-    if not os.path.exists(TEMPLATE_PATH):
-        raise FileNotFoundError(f"No se encontró la plantilla en {TEMPLATE_PATH}")
-    with open(TEMPLATE_PATH, "rb") as f:
-        tpl_bytes = f.read()
-    filled_docx = fill_docx_with_mapping(tpl_bytes, mapping)
+def generate_pdf_from_template(mapping: dict, template: str | None = None) -> bytes:
+    # Import local: app.templates depende de las utilidades DOCX de este módulo
+    from app.templates import registry
+    filled_docx = registry.get(template).fill(mapping)
     return docx_to_pdf_bytes(filled_docx)
 
 # -------------------------- EXCEL UTILITIES --------------------------
@@ -90,50 +224,317 @@ WANTED_KEYS = [
     "&FECHA_ABONO&", "&TOTAL&", "&LIQUIDAR&"
 ]
 
-def build_mapping_from_row(row: dict) -> dict:
-    # Normaliza claves: sin espacios ni &
-    norm = {
-        str(k).strip().lower().replace(" ", "").replace("&", ""): (
-            "" if v is None else str(v)
-        )
-        for k, v in row.items()
-    }
+# Se calculan en apply_totals: no hace falta que vengan en la hoja
+COMPUTED_TOKENS = ("&TOTAL&", "&LIQUIDAR&")
+
+_mangled_re = re.compile(r"^(.*)\.\d+$")   # pandas renombra encabezados repetidos: "Nombre.1"
 
-    mapping = {}
-    for token in WANTED_KEYS:
-        core = token.strip("&").lower().replace(" ", "")
-        value = norm.get(core, "")
+def normalize_header(header) -> str:
+    """'Dir Salida' / '&DIR_SALIDA&' -> 'dir_salida'"""
+    return str(header).strip().lower().replace(" ", "").replace("&", "")
 
-        # fallback para compatibilidad: si SUBTOTAL no existe, usa TOTAL
-        if token == "&SUBTOTAL&" and not value and "total" in norm:
-            value = norm["total"]
+class HeaderPlan:
+    """
+    Normalización de encabezados hecha UNA vez por hoja.
 
-        mapping[token] = value
+    `sources[token]` es la lista (índice de columna, encabezado) de donde sale
+    ese token, en orden de prioridad: nombre exacto, nombre sin guiones bajos
+    ("DirSalida") y, sólo para &SUBTOTAL&, la columna TOTAL de hojas viejas.
+    Se gana el primer valor no vacío.
 
-    return mapping
+    Reporta de antemano:
+      unknown     encabezados que no alimentan ningún token
+      duplicates  token -> encabezados que compiten por él
+      missing     tokens sin ninguna columna (salvo los que se calculan)
+    """
+
+    def __init__(self, headers, tokens=None):
+        self.headers = list(headers)
+        self.tokens = list(tokens or WANTED_KEYS)
+        norm = [normalize_header(h) for h in self.headers]
+        # "nombre.1" cuenta como "nombre" si pandas lo renombró por repetido
+        base = []
+        for n in norm:
+            m = _mangled_re.match(n)
+            base.append(m.group(1) if m and m.group(1) in norm else n)
+
+        self.sources: dict[str, list[tuple[int, str]]] = {}
+        used = set()
+        for token in self.tokens:
+            core = normalize_header(token)
+            exact = [i for i, b in enumerate(base) if b == core]
+            squashed = [i for i, b in enumerate(base) if b != core and b == core.replace("_", "")]
+            fallback = [i for i, b in enumerate(base) if b == "total"] if token == "&SUBTOTAL&" else []
+            idx = exact + squashed + fallback
+            self.sources[token] = [(i, self.headers[i]) for i in idx]
+            used.update(idx)
+
+        self.unknown = [h for i, h in enumerate(self.headers) if i not in used]
+        self.missing = [t for t in self.tokens if not self.sources[t] and t not in COMPUTED_TOKENS]
+        # la columna TOTAL como respaldo de SUBTOTAL no es un conflicto
+        self.duplicates = {
+            t: [h for i, h in src if t != "&SUBTOTAL&" or base[i] != "total"]
+            for t, src in self.sources.items()
+        }
+        self.duplicates = {t: hs for t, hs in self.duplicates.items() if len(hs) > 1}
+
+    def report(self) -> dict:
+        return {"unknown": self.unknown, "duplicates": self.duplicates, "missing": self.missing}
+
+    def mapping_from_row(self, row: dict) -> dict:
+        mapping = {}
+        for token, src in self.sources.items():
+            value = ""
+            for _, header in src:
+                v = row.get(header)
+                if v is not None and str(v) != "":
+                    value = str(v)
+                    break
+            mapping[token] = value
+        return mapping
+
+    def frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Columnas = tokens, todo como texto limpio, procesando columna por
+        columna (cada columna de la hoja se limpia una sola vez). Vacíos => "".
+        """
+        cleaned = {}
+        out = {}
+        for token, src in self.sources.items():
+            for i, _ in src:
+                if i not in cleaned:
+                    cleaned[i] = clean_text_column(df.iloc[:, i])
+            if not src:
+                out[token] = pd.Series("", index=df.index, dtype=object)
+                continue
+            # de menor a mayor prioridad: cada fuente pisa a la anterior donde trae valor
+            col = cleaned[src[-1][0]]
+            for i, _ in reversed(src[:-1]):
+                col = cleaned[i].where(cleaned[i] != "", col)
+            out[token] = col
+        return pd.DataFrame(out, index=df.index)
+
+@lru_cache(maxsize=64)
+def header_plan(headers: tuple, tokens: tuple | None = None) -> HeaderPlan:
+    plan = HeaderPlan(headers, tokens)
+    if plan.unknown or plan.duplicates:
+        logger.info("encabezados: %s", plan.report())
+    return plan
 
+def build_mapping_from_row(row: dict, tokens=None) -> dict:
+    """
+    Arma el mapping token -> valor. `tokens` permite usar el esquema de
+    otra plantilla del registro; por defecto se usan WANTED_KEYS.
+    El plan de encabezados se calcula una vez por combinación de columnas.
+    """
+    plan = header_plan(tuple(row.keys()), tuple(tokens) if tokens else None)
+    return plan.mapping_from_row(row)
+
+
+_num_re = re.compile(r"[^\d\-,.\s]")
+
+def parse_num(val) -> float:
+    """
+    Convierte a float tolerando '1,500', '1 500', '$1,500.00', etc.
+    Vacíos o None => 0.0
+    """
+    if val is None:
+        return 0.0
+    s = str(val).strip()
+    if not s:
+        return 0.0
+    s = _num_re.sub("", s)
+    s = s.replace(" ", "")
+    if "," in s and "." in s:
+        s = s.replace(",", "")
+    elif "," in s and "." not in s:
+        s = s.replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        return 0.0
+
+def clean_text(v) -> str:
+    """Celda leída como texto: recorta espacios, vacíos => "" y quita comas de miles (3,000.00 -> 3000.0)."""
+    if not isinstance(v, str):
+        return ""
+    v = v.strip()
+    if v.replace(",", "").replace(".", "", 1).isdigit():
+        try:
+            v = str(float(v.replace(",", "")))
+        except ValueError:
+            pass
+    return v
+
+def _by_unique(s: pd.Series, fn, dtype=object) -> pd.Series:
+    """
+    Aplica `fn` a cada valor DISTINTO de la columna y expande el resultado con
+    los códigos de factorize. En una hoja de órdenes los montos, fechas y
+    destinos se repiten mucho, así que `fn` corre muchas menos veces que filas.
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    values = np.array([fn(u) for u in uniques], dtype=dtype)
+    return pd.Series(values[codes], index=s.index)
+
+def clean_text_column(s: pd.Series) -> pd.Series:
+    """clean_text para una columna completa."""
+    return _by_unique(s, clean_text)
+
+def parse_num_column(s: pd.Series) -> pd.Series:
+    """parse_num para una columna completa."""
+    return _by_unique(s, parse_num, float)
+
+def apply_totals(mapping: dict) -> dict:
+    """
+    Usa &SUBTOTAL&, &DESCUENTO&, &ABONADO& para calcular:
+      TOTAL    = SUBTOTAL - DESCUENTO
+      LIQUIDAR = TOTAL - ABONADO
+    Reescribe &SUBTOTAL&, &TOTAL&, &LIQUIDAR& en el mapping y devuelve los números.
+    """
+    subtotal  = parse_num(mapping.get("&SUBTOTAL&"))
+    descuento = parse_num(mapping.get("&DESCUENTO&"))
+    abonado   = parse_num(mapping.get("&ABONADO&"))
+
+    total    = subtotal - descuento
+    liquidar = total - abonado
+
+    # asegúrate de que la plantilla reciba estos tokens actualizados
+    mapping["&SUBTOTAL&"] = f"{subtotal:.2f}"
+    mapping["&TOTAL&"]    = f"{total:.2f}"
+    mapping["&LIQUIDAR&"] = f"{liquidar:.2f}"
+    return {"subtotal": subtotal, "descuento": descuento, "abonado": abonado, "total": total, "liquidar": liquidar}
+
+def apply_totals_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """apply_totals para todas las filas de HeaderPlan.frame a la vez."""
+    subtotal  = parse_num_column(frame["&SUBTOTAL&"])
+    descuento = parse_num_column(frame["&DESCUENTO&"])
+    abonado   = parse_num_column(frame["&ABONADO&"])
+    total     = subtotal - descuento
+    liquidar  = total - abonado
+
+    fmt = "{:.2f}".format
+    frame["&SUBTOTAL&"] = _by_unique(subtotal, fmt)
+    frame["&TOTAL&"]    = _by_unique(total, fmt)
+    frame["&LIQUIDAR&"] = _by_unique(liquidar, fmt)
+    return pd.DataFrame({
+        "subtotal": subtotal, "descuento": descuento, "abonado": abonado, "total": total, "liquidar": liquidar,
+    })
 
-def read_first_row_from_excel(file_bytes: bytes, sheet_name: str | None = None) -> dict:
+def mapping_from_data(data: dict, tokens=()) -> dict:
     """
-    Lee el Excel y devuelve la primera fila con datos,
+    Mapping de la plantilla desde un dict con los campos de la orden
+    (JSON de /pdf/from-data o una fila de `orders`). Recalcula total y liquidar.
+    `tokens` agrega los tokens extra de otras plantillas (recibos, cotizaciones...).
+    """
+    def g(k: str) -> str:
+        for cand in (k, k.lower(), k.upper()):
+            if cand in data:
+                v = data[cand]
+                return "" if v is None else str(v)
+        return ""
+
+    # parseamos y recalculamos (si no hay datos, 0)
+    subtotal  = parse_num(g("subtotal"))
+    descuento = parse_num(g("descuento"))
+    abonado   = parse_num(g("abonado"))
+    total     = subtotal - descuento
+    liquidar  = total - abonado
+
+    mapping = {
+        "&NOMBRE&": g("nombre"),
+        "&FECHA&": g("fecha"),
+        "&DIR_SALIDA&": g("dir_salida"),
+        "&DIR_DESTINO&": g("dir_destino"),
+        "&HOR_IDA&": g("hor_ida"),
+        "&HOR_REGRESO&": g("hor_regreso"),
+        "&DURACION&": g("duracion"),
+        "&CAPACIDADU&": g("capacidadu"),
+
+        # números formateados
+        "&SUBTOTAL&": f"{subtotal:.2f}",
+        "&DESCUENTO&": f"{descuento:.2f}",
+        "&TOTAL&": f"{total:.2f}",
+        "&ABONADO&": f"{abonado:.2f}",
+        "&FECHA_ABONO&": g("fecha_abono"),
+        "&LIQUIDAR&": f"{liquidar:.2f}",
+    }
+    for token in tokens:
+        if token not in mapping:
+            mapping[token] = g(token.strip("&"))
+    return mapping
+
+def read_first_row_from_excel(source: bytes | str, sheet_name: str | None = None) -> dict:
+    """
+    Lee el Excel (bytes o ruta en disco) y devuelve la primera fila con datos,
     limpiando comas y espacios para números y celdas vacías.
     """
-    with BytesIO(file_bytes) as bio:
-        df = pd.read_excel(bio, sheet_name=sheet_name, dtype=str)  # todo como texto para evitar errores
+    # sheet_name=None haría que pandas devuelva TODAS las hojas en un dict
+    if isinstance(source, bytes):
+        with BytesIO(source) as bio:
+            df = pd.read_excel(bio, sheet_name=sheet_name or 0, dtype=str, nrows=1)  # todo como texto para evitar errores
+    else:
+        df = pd.read_excel(source, sheet_name=sheet_name or 0, dtype=str, nrows=1)
     if df.empty:
         raise ValueError("El Excel no tiene filas.")
+    return {k: clean_text(v) for k, v in df.iloc[0].items()}
+
+
+# -------------------------- HORAS Y DESTINOS --------------------------
+def parse_time(value: str) -> datetime:
+    """
+    Parser ultra tolerante:
+    - Soporta 12h y 24h
+    - Limpia 'a.m.', 'am', 'AM', 'p.m.', 'pm'
+    - Soporta casos inválidos como '17:33:00 am'
+      → interpreta como 24h ignorando el sufijo
+    """
+
+    if not value:
+        raise ValueError("Hora vacía")
+
+    raw = value.strip().lower()
+    raw = raw.replace("a.m.", "am").replace("p.m.", "pm").replace(".", "").strip()
+
+    # Detecta si el usuario intentó usar AM/PM
+    has_ampm = ("am" in raw) or ("pm" in raw)
 
-    # Normaliza valores
-    first = df.iloc[0].to_dict()
-    clean_row = {}
-    for k, v in first.items():
-        if isinstance(v, str):
-            v = v.strip()
-            # Reemplaza comas de miles (3,000.00 -> 3000.00)
-            if v.replace(",", "").replace(".", "", 1).isdigit():
+    # Extraemos solo los números de la hora
+    time_numbers = re.findall(r"\d+", raw)
+
+    # Si el prefijo numérico es mayor que 12, NO puede ser 12h → 24h forzado
+    try:
+        hour = int(time_numbers[0])
+        if hour > 12 and has_ampm:
+            # limpiamos am/pm y tratamos como 24h
+            raw_24 = re.sub(r"(am|pm)", "", raw).strip()
+            formats_24 = ["%H:%M:%S", "%H:%M"]
+            for fmt in formats_24:
                 try:
-                    v = str(float(v.replace(",", "")))
-                except ValueError:
+                    return datetime.strptime(raw_24, fmt)
+                except:
                     pass
-        clean_row[k] = v
-    return clean_row
\ No newline at end of file
+    except:
+        pass
+
+    # ------- Intento normal 12h -------
+    if has_ampm:
+        raw2 = re.sub(r"(am|pm)$", r" \1", raw.replace(" ", ""))  # agrega espacio si falta
+        for fmt in ["%I:%M:%S %p", "%I:%M %p", "%I %p"]:
+            try:
+                return datetime.strptime(raw2.upper(), fmt)
+            except:
+                pass
+
+    # ------- Intento 24h -------
+    for fmt in ["%H:%M:%S", "%H:%M"]:
+        try:
+            return datetime.strptime(raw, fmt)
+        except:
+            pass
+
+    raise ValueError(f"Formato de hora no reconocido: '{value}'")
+
+def is_cantaritos(destino: str) -> bool:
+    destino = destino.lower()
+    keywords = ["cantaritos", "amatitlan", "tequila"]
+    return any(k in destino for k in keywords)
@@ -0,0 +1,47 @@
+# app/migrations.py
+"""
+Mini-migraciones portables (SQLite y PostgreSQL).
+
+create_all crea las tablas nuevas; después se agregan las columnas que el
+modelo tiene y la base no (bases viejas que nacieron con menos campos). Los
+tipos se compilan con el dialecto del engine, así que el mismo modelo sirve
+para ambos motores.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.database import Base
+from app import models  # noqa: F401  (registra las tablas en Base.metadata)
+
+# Llave arbitraria para pg_advisory_xact_lock: serializa el arranque entre réplicas
+PG_MIGRATION_LOCK = 742_019_001
+
+
+def missing_columns(engine: Engine | Connection) -> list[tuple[str, str, str]]:
+    """(tabla, columna, tipo DDL) que faltan en la base respecto al modelo."""
+    insp = inspect(engine)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name not in existing:
+                missing.append((table.name, col.name, col.type.compile(dialect=engine.dialect)))
+    return missing
+
+
+def run_migrations(engine: Engine) -> list[str]:
+    """Crea tablas y columnas faltantes; devuelve las sentencias ALTER aplicadas."""
+    applied = []
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # entre hosts distintos el candado de archivo no alcanza
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": PG_MIGRATION_LOCK})
+        Base.metadata.create_all(bind=conn)
+        preparer = engine.dialect.identifier_preparer
+        for table, column, ddl_type in missing_columns(conn):
+            stmt = f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {preparer.quote(column)} {ddl_type}"
+            conn.execute(text(stmt))
+            applied.append(stmt)
+    return applied
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Text
 from datetime import datetime
 from app.database import Base  # ✅ ya no con ".."
 
@@ -25,6 +25,7 @@ class Order(Base):
     liquidar = Column(Float, nullable=True)   # total - abonado
 
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class User(Base):
     __tablename__ = "users"
@@ -33,4 +34,20 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
     fullname = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class FormSubmission(Base):
+    """Llaves de idempotencia de /orders/form-submit (reintentos de Apps Script)."""
+    __tablename__ = "form_submissions"
+
+    key = Column(String(64), primary_key=True)   # Idempotency-Key o sha256 del payload
+    order_id = Column(Integer, nullable=False)
+    response = Column(Text, nullable=False)       # JSON devuelto originalmente
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class DataGeneration(Base):
+    """Contador de generación de datos compartido entre hosts (PostgreSQL; ver app.shared_state)."""
+    __tablename__ = "data_generations"
+
+    name = Column(String(32), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
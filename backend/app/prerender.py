@@ -0,0 +1,220 @@
+# app/prerender.py
+"""
+Pre-render de PDFs para los próximos viajes.
+
+Los PDFs se piden en ráfaga el día antes de cada viaje, justo cuando más
+duele la latencia de LibreOffice. Este planificador corre dentro del proceso
+web y cada PRERENDER_INTERVAL_SECONDS busca:
+
+  - órdenes cuya `fecha` (YYYY-MM-DD) cae entre hoy y hoy + PRERENDER_DAYS, y
+  - órdenes modificadas (updated_at) desde la revisión anterior,
+
+y deja su PDF en el almacén de artefactos si todavía no está. Como la llave
+del almacén depende del contenido, una orden editada vuelve a aparecer como
+pendiente sola.
+
+Prioridad baja: cada PDF espera a que el pipeline no tenga más de
+PRERENDER_IDLE_PENDING trabajos de peticiones en vuelo, y nunca hay más de
+PRERENDER_CONCURRENCY renders de pre-calentado a la vez. Con varios workers,
+sólo el que obtiene el candado `prerender` corre el ciclo.
+
+Configuración por entorno:
+  PRERENDER_ENABLED           1/0 (por defecto 1)
+  PRERENDER_DAYS              días hacia adelante (por defecto 2: hoy, mañana y pasado)
+  PRERENDER_INTERVAL_SECONDS  pausa entre ciclos
+  PRERENDER_CONCURRENCY       renders simultáneos de pre-calentado
+  PRERENDER_IDLE_PENDING      trabajos en vuelo tolerados para considerar "ocioso"
+  PRERENDER_MAX_PER_CYCLE     tope de PDFs por ciclo
+"""
+import asyncio
+import logging
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from app.artifacts import artifacts, artifact_key
+from app.crud import fecha_until, order_as_dict
+from app.database import SessionLocal
+from app.main_utils import mapping_from_data
+from app.models import Order
+from app.render_pool import pipeline, PipelineBusy
+from app.shared_state import generation, try_lock
+from app.templates import registry
+
+logger = logging.getLogger(__name__)
+
+PRERENDER_ENABLED = os.getenv("PRERENDER_ENABLED", "1") == "1"
+PRERENDER_DAYS = int(os.getenv("PRERENDER_DAYS", "2"))
+PRERENDER_INTERVAL_SECONDS = float(os.getenv("PRERENDER_INTERVAL_SECONDS", "300"))
+PRERENDER_CONCURRENCY = int(os.getenv("PRERENDER_CONCURRENCY", "1"))
+PRERENDER_IDLE_PENDING = int(os.getenv("PRERENDER_IDLE_PENDING", "0"))
+PRERENDER_MAX_PER_CYCLE = int(os.getenv("PRERENDER_MAX_PER_CYCLE", "200"))
+
+# espera entre consultas mientras el pipeline está ocupado con peticiones
+IDLE_POLL_SECONDS = 0.5
+
+
+class Prerenderer:
+    def __init__(self, days: int, interval: float, concurrency: int, idle_pending: int, max_per_cycle: int):
+        self.days = days
+        self.interval = interval
+        self.concurrency = max(concurrency, 1)
+        self.idle_pending = idle_pending
+        self.max_per_cycle = max_per_cycle
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+        self._stopping = False
+        self._leader = None          # archivo del candado mientras somos líder
+        self._watermark: datetime | None = None
+        self._last_scan: tuple | None = None
+        self._stats = {
+            "cycles": 0, "skipped_cycles": 0, "candidates": 0, "already_cached": 0,
+            "rendered": 0, "errors": 0, "busy": 0, "seconds": 0.0,
+        }
+        self._last_cycle: dict | None = None
+
+    # -------------------------- ciclo de vida --------------------------
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._task is not None:
+            self._wake.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._leader is not None:
+            self._leader.close()
+            self._leader = None
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            if self._leader is None:
+                self._leader = try_lock("prerender")
+            if self._leader is not None:
+                try:
+                    await self.run_cycle()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("pre-render: ciclo fallido")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # -------------------------- ciclo --------------------------
+    def _collect(self, template, since: datetime | None) -> tuple[list, int]:
+        """(trabajos pendientes, cuántos ya estaban en el almacén) — corre en un hilo."""
+        today = date.today()
+        window = (today.isoformat(), (today + timedelta(days=self.days)).isoformat())
+        conds = [and_(Order.fecha >= window[0], fecha_until(window[1]))]
+        if since is not None:
+            conds.append(Order.updated_at >= since)
+        db = SessionLocal()
+        try:
+            orders = db.query(Order).filter(or_(*conds)).order_by(Order.fecha, Order.hor_ida, Order.id).all()
+        finally:
+            db.close()
+        jobs, cached = [], 0
+        for o in orders:
+            mapping = mapping_from_data(order_as_dict(o), template.tokens)
+            key = artifact_key(template, mapping)
+            if artifacts.contains(key):
+                cached += 1
+            else:
+                jobs.append((o.id, key, mapping))
+        return jobs[:self.max_per_cycle], cached
+
+    async def run_cycle(self) -> dict:
+        template = registry.get()
+        # sin commits nuevos, mismo día y misma plantilla: no hay nada nuevo que buscar
+        scan = (generation.current(), date.today(), template.name, template.mtime)
+        if scan == self._last_scan:
+            self._stats["skipped_cycles"] += 1
+            return self._last_cycle or {}
+
+        started = datetime.utcnow()
+        t0 = time.perf_counter()
+        jobs, cached = await asyncio.to_thread(self._collect, template, self._watermark)
+        self._stats["cycles"] += 1
+        self._stats["candidates"] += len(jobs) + cached
+        self._stats["already_cached"] += cached
+
+        sem = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._warm(sem, template.name, *job) for job in jobs))
+        failed = results.count(False)
+
+        if len(jobs) < self.max_per_cycle:
+            self._watermark = started
+        # si algo falló (o quedaron pendientes por el tope) el próximo ciclo vuelve a buscar
+        self._last_scan = scan if not failed and len(jobs) < self.max_per_cycle else None
+        self._stats["seconds"] += time.perf_counter() - t0
+        self._last_cycle = {
+            "at": started.isoformat() + "Z",
+            "candidates": len(jobs) + cached,
+            "already_cached": cached,
+            "rendered": results.count(True),
+            "failed": failed,
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+        if jobs:
+            logger.info("pre-render: %s", self._last_cycle)
+        return self._last_cycle
+
+    async def _wait_idle(self) -> None:
+        while self._pipeline_busy() and not self._stopping:
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+
+    def _pipeline_busy(self) -> bool:
+        return pipeline.pending > self.idle_pending
+
+    async def _warm(self, sem: asyncio.Semaphore, template: str, order_id: int, key: str, mapping: dict) -> bool:
+        async with sem:
+            await self._wait_idle()
+            if self._stopping:
+                return False
+            workdir = pipeline.new_workdir()
+            try:
+                pdf_path = await pipeline.render_pdf(mapping, template, workdir)
+                artifacts.put(key, pdf_path, warmed=True)
+                self._stats["rendered"] += 1
+                return True
+            except PipelineBusy:
+                # se llenó entre la espera y la admisión: lo reintenta el próximo ciclo
+                self._stats["busy"] += 1
+                return False
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning("pre-render: orden %s falló: %s", order_id, e)
+                return False
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "leader": self._leader is not None,
+            "days": self.days,
+            "interval_seconds": self.interval,
+            "concurrency": self.concurrency,
+            "stats": {**self._stats, "seconds": round(self._stats["seconds"], 3)},
+            "last_cycle": self._last_cycle,
+        }
+
+
+prerender = Prerenderer(
+    PRERENDER_DAYS, PRERENDER_INTERVAL_SECONDS, PRERENDER_CONCURRENCY,
+    PRERENDER_IDLE_PENDING, PRERENDER_MAX_PER_CYCLE,
+)
@@ -0,0 +1,245 @@
+# app/render_pool.py
+"""
+Pipeline de render fuera del event loop.
+
+Las etapas CPU-bound (leer el Excel, rellenar la plantilla, reempaquetar el
+ZIP) y la conversión con LibreOffice se ejecutan en un ProcessPoolExecutor,
+así que no compiten por el GIL del proceso que atiende HTTP.
+
+Configuración por entorno:
+  RENDER_WORKERS           procesos del pool (0 = en hilos del proceso actual)
+  RENDER_MAX_PENDING       trabajos en vuelo antes de responder 503
+  RENDER_SHUTDOWN_TIMEOUT  segundos para drenar trabajos al apagar
+  RENDER_START_METHOD      método de multiprocessing (spawn por defecto)
+  RENDER_TMP_DIR           dónde se crean los directorios de trabajo por PDF
+
+Entre etapas viajan rutas, no documentos: el Excel subido, el DOCX y el PDF
+viven en un directorio de trabajo por petición que borra quien lo pidió
+(normalmente después de enviar la respuesta).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.main_utils import (
+    convert_docx_to_pdf, lo_profile, merge_document_xml, read_first_row_from_excel, rebuild_docx_to_file,
+    tolerant_replace,
+)
+from app.templates import DOCUMENT_PATH, registry
+from app.tracing import annotate, span
+
+logger = logging.getLogger(__name__)
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", str(max(RENDER_WORKERS, 1) * 4)))
+RENDER_SHUTDOWN_TIMEOUT = float(os.getenv("RENDER_SHUTDOWN_TIMEOUT", "30"))
+RENDER_START_METHOD = os.getenv("RENDER_START_METHOD", "spawn")
+RENDER_TMP_DIR = os.getenv("RENDER_TMP_DIR") or None
+
+STAGES = ("parse", "fill", "repack", "convert")
+
+
+class PipelineBusy(RuntimeError):
+    """Se alcanzó RENDER_MAX_PENDING o el pipeline se está apagando."""
+
+
+class ConversionError(RuntimeError):
+    """Fallo de LibreOffice; el mensaje lleva su stderr."""
+
+
+# -------------------------- ETAPAS (se ejecutan en los workers) --------------------------
+def _init_worker() -> None:
+    # compila las plantillas al arrancar el worker y no en su primer PDF
+    registry.refresh()
+    # reserva el perfil de LibreOffice (y su limpieza al salir del worker)
+    lo_profile()
+
+def _stage_parse(source: bytes | str, sheet: str | None) -> dict:
+    return read_first_row_from_excel(source, sheet_name=sheet)
+
+def _stage_fill(template: str, mapping: dict) -> bytes:
+    tpl = registry.get(template)
+    return tolerant_replace(tpl.xml, mapping, tpl.patterns).encode("utf-8")
+
+def _stage_fill_many(template: str, mappings: list[dict]) -> bytes:
+    tpl = registry.get(template)
+    parts = [tolerant_replace(tpl.xml, m, tpl.patterns) for m in mappings]
+    return merge_document_xml(parts).encode("utf-8")
+
+def _stage_repack(template: str, xml: bytes, dest_path: str) -> str:
+    tpl = registry.get(template)
+    return rebuild_docx_to_file(tpl.docx_bytes, xml, dest_path, DOCUMENT_PATH, tpl.prefix)
+
+def _stage_convert(docx_path: str) -> tuple[str, str]:
+    try:
+        return convert_docx_to_pdf(docx_path)
+    except subprocess.CalledProcessError as e:
+        # CalledProcessError pierde stderr al cruzar procesos
+        raise ConversionError((e.stderr or b"").decode("utf-8", errors="ignore")) from None
+
+
+# -------------------------- PIPELINE --------------------------
+class RenderPipeline:
+    def __init__(self, workers: int, max_pending: int, shutdown_timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.shutdown_timeout = shutdown_timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        self._restarts = 0
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._pending = 0
+        self._closing = False
+        self._stats = {s: {"queued": 0, "running": 0, "done": 0, "errors": 0, "seconds": 0.0} for s in STAGES}
+
+    def start(self) -> None:
+        self._closing = False
+        if self.workers > 0 and self._executor is None:
+            self._executor = self._new_executor()
+        # cada etapa puede ocupar como mucho todos los workers
+        limit = max(self.workers, 1)
+        self._semaphores = {s: asyncio.Semaphore(limit) for s in STAGES}
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(RENDER_START_METHOD),
+            initializer=_init_worker,
+        )
+        # el pool crea los procesos bajo demanda; los levantamos ya
+        for _ in range(self.workers):
+            executor.submit(int)
+        return executor
+
+    def _replace_broken(self, broken: ProcessPoolExecutor) -> None:
+        """
+        Un worker murió (OOM, segfault de LibreOffice...) y el pool entero quedó
+        inutilizable: se cambia por uno nuevo. Sólo la primera etapa que lo nota
+        lo reemplaza; las demás ya encuentran el nuevo.
+        """
+        with self._pool_lock:
+            if self._executor is not broken or self._closing:
+                return
+            self._executor = self._new_executor()
+            self._restarts += 1
+        logger.warning("render: el pool de procesos se rompió; se reemplazó (reinicio #%s)", self._restarts)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _in_pool(self, fn, *args):
+        """Corre en el pool; si se rompe, lo reemplaza y reintenta una vez (luego 503)."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._replace_broken(executor)
+                if attempt or self._closing:
+                    raise PipelineBusy("El servicio de PDFs se está reiniciando, intenta de nuevo en unos segundos")
+
+    async def shutdown(self) -> None:
+        """Deja de aceptar trabajos, drena los que están en vuelo y cierra el pool."""
+        self._closing = True
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, stage: str, fn, *args):
+        stats = self._stats[stage]
+        stats["queued"] += 1
+        started = False
+        queued_at = time.perf_counter()
+        try:
+            async with self._semaphores[stage]:
+                stats["queued"] -= 1
+                stats["running"] += 1
+                started = True
+                t0 = time.perf_counter()
+                try:
+                    # la espera por el semáforo va aparte: separa "pool saturado" de "etapa lenta"
+                    with span(stage, wait_ms=round((t0 - queued_at) * 1000, 2)):
+                        if self._executor is not None:
+                            return await self._in_pool(fn, *args)
+                        return await asyncio.to_thread(fn, *args)
+                except Exception:
+                    stats["errors"] += 1
+                    raise
+                finally:
+                    stats["running"] -= 1
+                    stats["done"] += 1
+                    stats["seconds"] += time.perf_counter() - t0
+        finally:
+            if not started:
+                stats["queued"] -= 1
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _admit(self) -> None:
+        if self._closing:
+            raise PipelineBusy("El servicio de PDFs se está deteniendo")
+        if self._pending >= self.max_pending:
+            raise PipelineBusy("Demasiados PDFs en proceso, intenta de nuevo en unos segundos")
+        self._pending += 1
+
+    def new_workdir(self) -> str:
+        return tempfile.mkdtemp(prefix="render-", dir=RENDER_TMP_DIR)
+
+    async def parse_excel(self, source: bytes | str, sheet: str | None = None) -> dict:
+        self._admit()
+        try:
+            return await self._run("parse", _stage_parse, source, sheet)
+        finally:
+            self._pending -= 1
+
+    async def render_pdf(self, mapping: dict, template: str | None, workdir: str) -> str:
+        """Genera el PDF dentro de `workdir` y devuelve su ruta."""
+        self._admit()
+        try:
+            template = registry.get(template).name
+            xml = await self._run("fill", _stage_fill, template, mapping)
+            docx_path = await self._run("repack", _stage_repack, template, xml, os.path.join(workdir, "orden.docx"))
+            return await self._convert(docx_path)
+        finally:
+            self._pending -= 1
+
+    async def render_merged_pdf(self, mappings: list[dict], template: str | None, workdir: str) -> str:
+        """Una sección por mapping en un solo DOCX: una sola conversión de LibreOffice."""
+        self._admit()
+        try:
+            template = registry.get(template).name
+            xml = await self._run("fill", _stage_fill_many, template, mappings)
+            docx_path = await self._run("repack", _stage_repack, template, xml, os.path.join(workdir, "lote.docx"))
+            return await self._convert(docx_path)
+        finally:
+            self._pending -= 1
+
+    async def _convert(self, docx_path: str) -> str:
+        pdf_path, output = await self._run("convert", _stage_convert, docx_path)
+        # avisos de LibreOffice (fuentes sustituidas, etc.) aunque no haya fallado
+        annotate("convert", soffice=output)
+        return pdf_path
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "closing": self._closing,
+            "pool_restarts": self._restarts,
+            "stages": {s: dict(v) for s, v in self._stats.items()},
+        }
+
+
+pipeline = RenderPipeline(RENDER_WORKERS, RENDER_MAX_PENDING, RENDER_SHUTDOWN_TIMEOUT)
@@ -1,11 +1,17 @@
-import re
+import hashlib
+import json
 from fastapi import APIRouter, Depends, HTTPException, Response, Request
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from datetime import timezone
 import os
+import orjson
+from sqlalchemy import select
 
 from app.database import SessionLocal
-from app.models import Order
+from app.models import Order, FormSubmission
+from app.shared_state import GenerationCache
+from app.main_utils import parse_time, is_cantaritos
 from app.deps import get_current_user
 from app.schemas import User
 
@@ -14,6 +20,9 @@ from app.schemas import User
 # ================================
 FORM_API_KEY = os.getenv("FORM_API_KEY", "super-secret-key")
 
+# Ventana en la que un reintento devuelve la orden original
+FORM_IDEMPOTENCY_TTL_HOURS = float(os.getenv("FORM_IDEMPOTENCY_TTL_HOURS", "48"))
+
 
 # ================================
 # 🟢 ENDPOINT PÚBLICO PARA GOOGLE FORMS
@@ -47,65 +56,6 @@ def assign_capacidad(pasajeros: int) -> int:
     else:
         return 45
 
-def parse_time(value: str) -> datetime:
-    """
-    Parser ultra tolerante:
-    - Soporta 12h y 24h
-    - Limpia 'a.m.', 'am', 'AM', 'p.m.', 'pm'
-    - Soporta casos inválidos como '17:33:00 am'
-      → interpreta como 24h ignorando el sufijo
-    """
-
-    if not value:
-        raise ValueError("Hora vacía")
-
-    raw = value.strip().lower()
-    raw = raw.replace("a.m.", "am").replace("p.m.", "pm").replace(".", "").strip()
-
-    # Detecta si el usuario intentó usar AM/PM
-    has_ampm = ("am" in raw) or ("pm" in raw)
-
-    # Extraemos solo los números de la hora
-    time_numbers = re.findall(r"\d+", raw)
-
-    # Si el prefijo numérico es mayor que 12, NO puede ser 12h → 24h forzado
-    try:
-        hour = int(time_numbers[0])
-        if hour > 12 and has_ampm:
-            # limpiamos am/pm y tratamos como 24h
-            raw_24 = re.sub(r"(am|pm)", "", raw).strip()
-            formats_24 = ["%H:%M:%S", "%H:%M"]
-            for fmt in formats_24:
-                try:
-                    return datetime.strptime(raw_24, fmt)
-                except:
-                    pass
-    except:
-        pass
-
-    # ------- Intento normal 12h -------
-    if has_ampm:
-        raw2 = re.sub(r"(am|pm)$", r" \1", raw.replace(" ", ""))  # agrega espacio si falta
-        for fmt in ["%I:%M:%S %p", "%I:%M %p", "%I %p"]:
-            try:
-                return datetime.strptime(raw2.upper(), fmt)
-            except:
-                pass
-
-    # ------- Intento 24h -------
-    for fmt in ["%H:%M:%S", "%H:%M"]:
-        try:
-            return datetime.strptime(raw, fmt)
-        except:
-            pass
-
-    raise ValueError(f"Formato de hora no reconocido: '{value}'")
-
-def is_cantaritos(destino: str) -> bool:
-    destino = destino.lower()
-    keywords = ["cantaritos", "amatitlan", "tequila"]
-    return any(k in destino for k in keywords)
-
 
 # TABLAS DE TARIFAS ESPECIALES
 CANTARITOS_PRICES = {
@@ -143,6 +93,39 @@ def determine_cantaritos_price(capacidad: int, hora_salida: str) -> float:
     return price_info["normal"]   # <<<<<<  🔥 ahora precio normal
 
 
+def idempotency_key(request: Request, payload: dict) -> str:
+    """
+    Usa el header Idempotency-Key si viene; si no, el hash del payload
+    (dos envíos idénticos dentro del TTL cuentan como el mismo).
+    """
+    header = request.headers.get("idempotency-key")
+    if header:
+        raw = "h:" + header.strip()
+    else:
+        raw = "p:" + json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def find_submission(db: Session, key: str) -> FormSubmission | None:
+    """
+    Envío previo con esta llave, sólo si su orden sigue existiendo. Si la
+    borraron, la llave se descarta y el envío cuenta como nuevo: SQLite puede
+    reutilizar ese id para otra orden y el replay apuntaría a la de alguien más.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=FORM_IDEMPOTENCY_TTL_HOURS)
+    sub = (
+        db.query(FormSubmission)
+        .filter(FormSubmission.key == key, FormSubmission.created_at >= cutoff)
+        .first()
+    )
+    if sub is not None and db.get(Order, sub.order_id) is None:
+        db.delete(sub)
+        db.flush()
+        return None
+    return sub
+
+def replay(sub: FormSubmission) -> dict:
+    return {**json.loads(sub.response), "replayed": True}
+
 @public_router.post("/form-submit", include_in_schema=False)
 def form_submit(request: Request, payload: dict, db: Session = Depends(get_db)):
     # --- Seguridad con API KEY ---
@@ -150,6 +133,12 @@ def form_submit(request: Request, payload: dict, db: Session = Depends(get_db)):
     if api_key != FORM_API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
+    # --- Reintento de un envío ya procesado: una sola búsqueda por índice ---
+    key = idempotency_key(request, payload)
+    existing = find_submission(db, key)
+    if existing:
+        return replay(existing)
+
     # --- Lectura de datos del formulario ---
     pasajeros_str = payload.get("personas", "0")
     pasajeros = int(pasajeros_str)
@@ -198,16 +187,31 @@ def form_submit(request: Request, payload: dict, db: Session = Depends(get_db)):
     )
 
     db.add(order)
-    db.commit()
-    db.refresh(order)
+    # limpia llaves vencidas (por índice en created_at), incluida una vieja con esta misma llave
+    cutoff = datetime.utcnow() - timedelta(hours=FORM_IDEMPOTENCY_TTL_HOURS)
+    db.query(FormSubmission).filter(FormSubmission.created_at < cutoff).delete(synchronize_session=False)
+    db.flush()
 
-    return {
+    result = {
         "status": "ok",
         "order_id": order.id,
         "capacidad_asignada": capacidadu,
         "duracion_horas": duracion,
         "precio_total": total
     }
+    db.add(FormSubmission(key=key, order_id=order.id, response=json.dumps(result)))
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # otro reintento concurrente ganó: se descarta esta orden y se devuelve la suya
+        db.rollback()
+        existing = find_submission(db, key)
+        if not existing:
+            raise
+        return replay(existing)
+
+    return result
 
 
 # ================================
@@ -219,6 +223,8 @@ private_router = APIRouter(
     dependencies=[Depends(get_current_user)]
 )
 
+orders_cache = GenerationCache()
+
 def serialize_order(o: Order) -> dict:
     if o.created_at:
         dt = o.created_at
@@ -249,11 +255,30 @@ def serialize_order(o: Order) -> dict:
         "created_at": created_iso,
     }
 
+# Mismas llaves y orden que serialize_order; el listado lee sólo estas columnas
+# como tuplas (sin armar objetos Order) y las codifica directo con orjson.
+ORDER_COLUMNS = (
+    "id", "nombre", "fecha", "dir_salida", "dir_destino", "hor_ida", "hor_regreso",
+    "duracion", "capacidadu", "subtotal", "descuento", "total", "abonado",
+    "fecha_abono", "liquidar", "created_at",
+)
+_order_columns = tuple(Order.__table__.c[name] for name in ORDER_COLUMNS)
+
+# created_at se guarda naive en UTC: "2025-01-31T12:00:00Z", igual que serialize_order
+_ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_OMIT_MICROSECONDS
+
+def orders_json(db: Session) -> bytes:
+    rows = db.execute(select(*_order_columns).order_by(Order.id.desc()))
+    return orjson.dumps([dict(zip(ORDER_COLUMNS, row)) for row in rows], option=_ORJSON_OPTIONS)
+
 @private_router.get("", response_model=list[dict])
 @private_router.get("/", response_model=list[dict])
 def list_orders(db: Session = Depends(get_db)):
-    orders = db.query(Order).order_by(Order.id.desc()).all()
-    return [serialize_order(o) for o in orders]
+    # JSON ya codificado: se recalcula sólo cuando algún proceso hizo commit de
+    # cambios. Al devolver un Response, FastAPI no re-valida contra
+    # response_model (queda sólo para la documentación).
+    body = orders_cache.get("list", lambda: orders_json(db), db)
+    return Response(content=body, media_type="application/json")
 
 @private_router.delete("/{order_id}", status_code=204)
 def delete_order(order_id: int, db: Session = Depends(get_db)):
@@ -261,6 +286,8 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     db.delete(order)
+    # sus llaves de idempotencia se van en el mismo commit (ver find_submission)
+    db.query(FormSubmission).filter(FormSubmission.order_id == order_id).delete(synchronize_session=False)
     db.commit()
     return Response(status_code=204)
 
@@ -1,25 +1,36 @@
 # app/routers/pdf.py
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse
+from multipart.multipart import MultipartParser, parse_options_header
 from sqlalchemy.orm import Session
-from io import BytesIO
+from starlette.background import BackgroundTask
+import asyncio
 import os
-import subprocess
-import re
+import shutil
 from typing import Any, Dict
 
 from app.database import SessionLocal
-from app.models import Order
-from app.main_utils import (
-    read_first_row_from_excel,
-    build_mapping_from_row,
-    generate_pdf_from_template,
-)
+from app.main_utils import WANTED_KEYS, apply_totals, build_mapping_from_row, concat_pdfs, mapping_from_data
+from app.crud import order_as_dict, order_from_mapping, orders_for_batch
+from app.artifacts import artifacts, artifact_key
+from app.prerender import prerender
+from app import tracing
+from app.tracing import span
+from app.render_pool import pipeline, PipelineBusy, ConversionError
+from app.templates import registry, TemplateNotFound
 from app.deps import get_current_user   # ✅ rutas protegidas
-from app.schemas import User            # (payload del usuario autenticado)
+from app.schemas import User, BatchPdfRequest  # (payload del usuario autenticado)
 
 router = APIRouter(prefix="/pdf", tags=["PDF"])
 
+# Tamaño máximo del Excel subido
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "10"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+# campos de texto del formulario (sheet, template) + límites multipart
+MAX_FORM_FIELDS_BYTES = 64 * 1024
+# Máximo de órdenes en un PDF combinado
+BATCH_MAX_ORDERS = int(os.getenv("BATCH_MAX_ORDERS", "200"))
+
 # ---- DB dependency ----
 def get_db():
     db = SessionLocal()
@@ -29,28 +40,124 @@ def get_db():
         db.close()
 
 # ---- Helpers ----
-_num_re = re.compile(r"[^\d\-,.\s]")
+def upload_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"El archivo supera {MAX_UPLOAD_MB:g} MB")
 
-def parse_num(val: Any) -> float:
+async def receive_upload(request: Request, workdir: str, file_field: str = "file") -> tuple[str, str, dict]:
     """
-    Convierte a float tolerando '1,500', '1 500', '$1,500.00', etc.
-    Vacíos o None => 0.0
+    Lee el multipart/form-data directo del request: el campo `file_field` se
+    escribe por bloques en `workdir` (una sola copia, nunca entero en memoria)
+    y los demás campos quedan en un dict. Devuelve (ruta, nombre original, campos).
+
+    Corta con 413 antes de leer el cuerpo si Content-Length ya pasa el límite,
+    y si no, en cuanto el archivo recibido lo pasa (uploads chunked).
     """
-    if val is None:
-        return 0.0
-    s = str(val).strip()
-    if not s:
-        return 0.0
-    s = _num_re.sub("", s)
-    s = s.replace(" ", "")
-    if "," in s and "." in s:
-        s = s.replace(",", "")
-    elif "," in s and "." not in s:
-        s = s.replace(",", ".")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > MAX_UPLOAD_BYTES + MAX_FORM_FIELDS_BYTES:
+        raise upload_too_large()
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Se esperaba multipart/form-data")
+
+    fields: dict[str, str] = {}
+    state = {"header": b"", "value": b"", "headers": {}, "name": None, "out": None, "data": b""}
+    upload = {"path": None, "filename": "", "written": 0, "field_bytes": 0}
+
+    def on_part_begin():
+        state.update(headers={}, name=None, out=None, data=b"")
+
+    def on_header_field(data, start, end):
+        state["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header"].lower()] = state["value"]
+        state["header"] = state["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", errors="replace")
+        state["name"] = name
+        if name == file_field and b"filename" in disposition and upload["path"] is None:
+            upload["filename"] = disposition[b"filename"].decode("utf-8", errors="replace")
+            ext = os.path.splitext(upload["filename"])[1] or ".xlsx"
+            upload["path"] = os.path.join(workdir, f"upload{ext}")
+            state["out"] = open(upload["path"], "wb")
+
+    def on_part_data(data, start, end):
+        size = end - start
+        if state["out"] is not None:
+            upload["written"] += size
+            if upload["written"] > MAX_UPLOAD_BYTES:
+                raise upload_too_large()
+            state["out"].write(data[start:end])
+        else:
+            upload["field_bytes"] += size
+            if upload["field_bytes"] > MAX_FORM_FIELDS_BYTES:
+                raise HTTPException(status_code=413, detail="Campos del formulario demasiado grandes")
+            state["data"] += data[start:end]
+
+    def on_part_end():
+        if state["out"] is not None:
+            state["out"].close()
+            state["out"] = None
+        elif state["name"]:
+            fields[state["name"]] = state["data"].decode("utf-8", errors="replace")
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
     try:
-        return float(s)
-    except ValueError:
-        return 0.0
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    finally:
+        if state["out"] is not None:
+            state["out"].close()
+    if upload["path"] is None:
+        raise HTTPException(status_code=422, detail=f"Falta el archivo ('{file_field}')")
+    return upload["path"], upload["filename"], fields
+
+# el cuerpo se lee a mano (receive_upload); esto sólo documenta el formulario en /docs
+EXCEL_FORM_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "sheet": {"type": "string"},
+                "template": {"type": "string"},
+            },
+        }}},
+    },
+}
+
+def pdf_file_response(pdf_path: str, workdir: str | None, filename: str, headers: dict | None = None) -> FileResponse:
+    # se sirve desde disco y el directorio de trabajo se borra tras el envío
+    # (workdir=None: el archivo vive en el almacén de artefactos y se queda)
+    return FileResponse(
+        pdf_path,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', **(headers or {})},
+        background=BackgroundTask(shutil.rmtree, workdir, ignore_errors=True) if workdir else None,
+    )
+
+def get_template(name: str | None):
+    try:
+        return registry.get(name)
+    except TemplateNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -60,66 +167,45 @@ def parse_num(val: Any) -> float:
 #   LIQUIDAR = TOTAL - ABONADO
 # Y en la plantilla rellena &SUBTOTAL&, &TOTAL&, &LIQUIDAR& (además de los demás).
 # ─────────────────────────────────────────────────────────────────────────────
-@router.post("/from-excel")
+@router.post("/from-excel", openapi_extra=EXCEL_FORM_OPENAPI)
 async def pdf_from_excel(
-    file: UploadFile = File(...),
-    sheet: str | None = Form(None),
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),  # ✅ protegido
 ):
+    workdir = pipeline.new_workdir()
     try:
-        xls_bytes = await file.read()
-        row = read_first_row_from_excel(xls_bytes, sheet_name=sheet)
-        mapping = build_mapping_from_row(row)
+        with span("upload"):
+            xls_path, upload_name, form = await receive_upload(request, workdir)
+        tpl = get_template(form.get("template") or None)
+        row = await pipeline.parse_excel(xls_path, form.get("sheet") or None)
+        # tokens de la orden + los propios de la plantilla elegida
+        mapping = build_mapping_from_row(row, list(dict.fromkeys([*WANTED_KEYS, *tpl.tokens])))
 
         # --- números base ---
-        subtotal  = parse_num(mapping.get("&SUBTOTAL&"))
-        descuento = parse_num(mapping.get("&DESCUENTO&"))
-        abonado   = parse_num(mapping.get("&ABONADO&"))
-
-        total    = subtotal - descuento
-        liquidar = total - abonado
-
-        # asegúrate de que la plantilla reciba estos tokens actualizados
-        mapping["&SUBTOTAL&"] = f"{subtotal:.2f}"
-        mapping["&TOTAL&"]    = f"{total:.2f}"
-        mapping["&LIQUIDAR&"] = f"{liquidar:.2f}"
+        totals = apply_totals(mapping)
 
         # --- generar PDF ---
-        pdf_bytes = generate_pdf_from_template(mapping)
+        pdf_path = await pipeline.render_pdf(mapping, tpl.name, workdir)
 
         # --- guardar orden ---
-        order = Order(
-            nombre=mapping.get("&NOMBRE&"),
-            fecha=mapping.get("&FECHA&"),
-            dir_salida=mapping.get("&DIR_SALIDA&"),
-            dir_destino=mapping.get("&DIR_DESTINO&"),
-            hor_ida=mapping.get("&HOR_IDA&"),
-            hor_regreso=mapping.get("&HOR_REGRESO&"),
-            duracion=mapping.get("&DURACION&"),
-            capacidadu=mapping.get("&CAPACIDADU&"),
-            subtotal=subtotal,           # 👈 nuevo campo
-            descuento=descuento,
-            total=total,                 # 👈 total final ya con descuento
-            abonado=abonado,
-            fecha_abono=mapping.get("&FECHA_ABONO&"),
-            liquidar=liquidar,
-        )
-        db.add(order)
-        db.commit()
-
-        filename = f'orden_{os.path.splitext(file.filename or "archivo")[0]}.pdf'
-        return StreamingResponse(
-            BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-        )
-    except subprocess.CalledProcessError as e:
-        return PlainTextResponse(
-            f"Error LibreOffice: {e.stderr.decode('utf-8', errors='ignore')}",
-            status_code=500,
-        )
+        with span("db"):
+            db.add(order_from_mapping(mapping, totals))
+            db.commit()
+
+        filename = f'orden_{os.path.splitext(upload_name or "archivo")[0]}.pdf'
+        return pdf_file_response(pdf_path, workdir, filename)
+    except HTTPException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    except PipelineBusy as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        return PlainTextResponse(str(e), status_code=503, headers={"Retry-After": "5"})
+    except ConversionError as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        return PlainTextResponse(f"Error LibreOffice: {e}", status_code=500)
     except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
         return PlainTextResponse(str(e), status_code=500)
 
 
@@ -130,52 +216,121 @@ async def pdf_from_excel(
 @router.post("/from-data")
 async def pdf_from_data(
     data: Dict[str, Any],
+    template: str | None = None,
+    current_user: User = Depends(get_current_user),  # ✅ protegido
+):
+    tpl = get_template(template)
+    mapping = mapping_from_data(data, tpl.tokens)
+    with span("artifact"):
+        key = artifact_key(tpl, mapping)
+        cached = artifacts.get(key)
+    tracing.annotate("artifact", hit=bool(cached))
+    if cached:
+        return pdf_file_response(cached, None, "orden.pdf", {"X-Artifact": "hit"})
+
+    workdir = pipeline.new_workdir()
+    try:
+        pdf_path = await pipeline.render_pdf(mapping, tpl.name, workdir)
+        with span("store"):
+            artifacts.put(key, pdf_path)
+        return pdf_file_response(pdf_path, workdir, "orden.pdf", {"X-Artifact": "miss"})
+    except PipelineBusy as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# POST /pdf/batch  → Un solo PDF con varias órdenes (por ids o por fecha)
+# Si todas las órdenes ya tienen su PDF en el almacén se concatenan sin
+# renderizar; si no, se rellena un DOCX con una sección por orden y se
+# convierte UNA vez con LibreOffice.
+# ─────────────────────────────────────────────────────────────────────────────
+def load_batch(ids: list[int] | None, fecha: str | None, tokens) -> list[dict]:
+    """
+    Mappings de las órdenes del lote, en un hilo y con su propia sesión: la
+    conexión vuelve al pool antes de renderizar (el render puede tardar segundos).
+    """
+    db = SessionLocal()
+    try:
+        orders = orders_for_batch(db, ids, fecha)
+        if len(orders) > BATCH_MAX_ORDERS:
+            raise HTTPException(status_code=422, detail=f"Máximo {BATCH_MAX_ORDERS} órdenes por PDF")
+        return [mapping_from_data(order_as_dict(o), tokens) for o in orders]
+    finally:
+        db.close()
+
+@router.post("/batch")
+async def pdf_batch(
+    body: BatchPdfRequest,
+    template: str | None = None,
     current_user: User = Depends(get_current_user),  # ✅ protegido
 ):
+    if not body.ids and not body.fecha:
+        raise HTTPException(status_code=422, detail="Indica 'ids' o 'fecha'")
+    tpl = get_template(template)
+    with span("db"):
+        mappings = await asyncio.to_thread(load_batch, body.ids, body.fecha, tpl.tokens)
+    if not mappings:
+        raise HTTPException(status_code=404, detail="No hay órdenes para imprimir")
+
+    with span("artifact"):
+        cached = [artifacts.get(artifact_key(tpl, m)) for m in mappings]
+    filename = f"ordenes_{body.fecha}.pdf" if body.fecha and not body.ids else "ordenes.pdf"
+    headers = {"X-Batch-Orders": str(len(mappings))}
+
+    workdir = pipeline.new_workdir()
     try:
-        def g(d: Dict[str, Any], k: str) -> str:
-            for cand in (k, k.lower(), k.upper()):
-                if cand in d:
-                    v = d[cand]
-                    return "" if v is None else str(v)
-            return ""
-
-        # leemos strings
-        s_subtotal  = g(data, "subtotal") or g(data, "SUBTOTAL")
-        s_descuento = g(data, "descuento")
-        s_abonado   = g(data, "abonado")
-
-        # parseamos y recalculamos (si no hay datos, 0)
-        subtotal  = parse_num(s_subtotal)
-        descuento = parse_num(s_descuento)
-        abonado   = parse_num(s_abonado)
-        total     = subtotal - descuento
-        liquidar  = total - abonado
-
-        mapping = {
-            "&NOMBRE&": g(data, "nombre"),
-            "&FECHA&": g(data, "fecha"),
-            "&DIR_SALIDA&": g(data, "dir_salida"),
-            "&DIR_DESTINO&": g(data, "dir_destino"),
-            "&HOR_IDA&": g(data, "hor_ida"),
-            "&HOR_REGRESO&": g(data, "hor_regreso"),
-            "&DURACION&": g(data, "duracion"),
-            "&CAPACIDADU&": g(data, "capacidadu"),
-
-            # números formateados
-            "&SUBTOTAL&": f"{subtotal:.2f}",
-            "&DESCUENTO&": f"{descuento:.2f}",
-            "&TOTAL&": f"{total:.2f}",
-            "&ABONADO&": f"{abonado:.2f}",
-            "&FECHA_ABONO&": g(data, "fecha_abono"),
-            "&LIQUIDAR&": f"{liquidar:.2f}",
-        }
-
-        pdf_bytes = generate_pdf_from_template(mapping)
-        return StreamingResponse(
-            BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={"Content-Disposition": 'attachment; filename="orden.pdf"'},
-        )
+        if all(cached):
+            with span("concat", pdfs=len(cached)):
+                pdf_path = await asyncio.to_thread(concat_pdfs, cached, os.path.join(workdir, "lote.pdf"))
+            headers["X-Batch-Mode"] = "cached"
+        else:
+            pdf_path = await pipeline.render_merged_pdf(mappings, tpl.name, workdir)
+            headers["X-Batch-Mode"] = "merged"
+        return pdf_file_response(pdf_path, workdir, filename, headers)
+    except PipelineBusy as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# GET /pdf/templates  → Plantillas disponibles y sus tokens
+# ─────────────────────────────────────────────────────────────────────────────
+@router.get("/templates")
+def list_templates(current_user: User = Depends(get_current_user)):
+    return registry.describe()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# GET /pdf/pipeline  → Colas y tiempos por etapa, almacén de PDFs y pre-render
+# ─────────────────────────────────────────────────────────────────────────────
+@router.get("/pipeline")
+def pipeline_metrics(current_user: User = Depends(get_current_user)):
+    return {**pipeline.metrics(), "artifacts": artifacts.metrics(), "prerender": prerender.metrics()}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# GET /pdf/traces  → Últimas trazas muestreadas de ESTE proceso (más nueva primero)
+#   ?limit=50&min_ms=500  → sólo las que tardaron al menos 500 ms
+# GET /pdf/traces/{trace_id}  → la traza de una respuesta (cabecera X-Trace-Id)
+# ─────────────────────────────────────────────────────────────────────────────
+@router.get("/traces")
+def list_traces(limit: int = 50, min_ms: float = 0.0, current_user: User = Depends(get_current_user)):
+    return {
+        "sample_rate": tracing.TRACE_SAMPLE_RATE,
+        "pid": os.getpid(),
+        "traces": tracing.recent(limit, min_ms),
+    }
+
+@router.get("/traces/{trace_id}")
+def get_trace(trace_id: str, current_user: User = Depends(get_current_user)):
+    trace = tracing.find(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Traza no encontrada (¿otro worker o ya salió del buffer?)")
+    return trace
@@ -10,4 +10,7 @@ class Token(BaseModel):
     token_type: str = "bearer"
 
 class User(BaseModel):
-    username: str
\ No newline at end of file
+    username: str
+class BatchPdfRequest(BaseModel):
+    ids: list[int] | None = None    # en el orden en que se imprimen
+    fecha: str | None = None        # o todas las órdenes de ese día (YYYY-MM-DD)
@@ -0,0 +1,219 @@
+# app/shared_state.py
+"""
+Estado compartido entre procesos (uvicorn --workers N / gunicorn).
+
+- file_lock(nombre): candado de archivo para que una sola réplica corra las
+  tareas de arranque (create_all + mini-migraciones) a la vez.
+- try_lock(nombre): lo mismo sin esperar; sirve para elegir una réplica líder
+  (p. ej. la que corre el pre-render).
+- generation: contador de generación de datos. Cada commit que toca filas
+  lo incrementa.
+    * SQLite: archivo mapeado en memoria (Generation); leerlo no hace syscalls.
+    * PostgreSQL: una fila de `data_generations` (DbGeneration), que sube en
+      la misma transacción que los datos. Las réplicas pueden estar en hosts
+      distintos y un mmap local no vería los commits de los demás; leerlo
+      cuesta una consulta por llave primaria.
+- GenerationCache: caché por proceso que se invalida sola cuando otra
+  réplica (o este mismo proceso) cambia la generación.
+
+Los archivos de candados (y el mmap con SQLite) viven en STATE_DIR (por
+defecto, junto a la base SQLite), así que todas las réplicas de la misma
+máquina los comparten. Con PostgreSQL en varios hosts los candados siguen
+siendo por host: el arranque usa además pg_advisory_xact_lock
+(app.migrations) y el pre-render elige un líder por host.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.database import engine
+from app.models import DataGeneration
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _default_state_dir() -> str:
+    if engine.url.get_backend_name() == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        return os.path.dirname(os.path.abspath(engine.url.database))
+    return tempfile.gettempdir()
+
+STATE_DIR = os.getenv("STATE_DIR") or _default_state_dir()
+
+
+@contextmanager
+def file_lock(name: str):
+    """Candado exclusivo entre procesos (bloquea hasta obtenerlo)."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, f".{name}.lock")
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def try_lock(name: str):
+    """
+    Candado exclusivo sin esperar: devuelve el archivo abierto (el candado dura
+    mientras siga abierto, o hasta que muera el proceso) o None si otro proceso
+    ya lo tiene.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    f = open(os.path.join(STATE_DIR, f".{name}.lock"), "a+b")
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+class Generation:
+    """Contador uint64 compartido vía mmap; bump() se serializa con file_lock."""
+
+    _fmt = "<Q"
+
+    def __init__(self, name: str):
+        self.name = name
+        self._mm: mmap.mmap | None = None
+        self._init_lock = threading.Lock()
+
+    def _map(self) -> mmap.mmap:
+        if self._mm is None:
+            with self._init_lock:
+                if self._mm is None:
+                    path = os.path.join(STATE_DIR, f".{self.name}.gen")
+                    with file_lock(self.name):
+                        with open(path, "a+b") as f:
+                            size = f.tell()
+                            if size < 8:
+                                f.write(b"\0" * (8 - size))
+                    with open(path, "r+b") as f:
+                        self._mm = mmap.mmap(f.fileno(), 8)
+        return self._mm
+
+    def current(self, session: Session | None = None) -> int:
+        # `session` sólo importa para DbGeneration; aquí leer no toca la base
+        return struct.unpack_from(self._fmt, self._map(), 0)[0]
+
+    def bump(self) -> int:
+        mm = self._map()
+        with file_lock(self.name):
+            value = struct.unpack_from(self._fmt, mm, 0)[0] + 1
+            struct.pack_into(self._fmt, mm, 0, value)
+        return value
+
+
+class DbGeneration:
+    """Generation respaldado por una fila de la base (réplicas en varios hosts)."""
+
+    def __init__(self, name: str, bind=engine):
+        self.name = name
+        self.bind = bind
+
+    def current(self, session: Session | None = None) -> int:
+        """
+        Con `session` se lee por la conexión que esa sesión ya tiene (o va a
+        usar): quien lee y luego carga datos no ocupa dos conexiones del pool.
+        """
+        stmt = select(DataGeneration.value).where(DataGeneration.name == self.name)
+        if session is not None:
+            return session.execute(stmt).scalar() or 0
+        with self.bind.connect() as conn:
+            return conn.execute(stmt).scalar() or 0
+
+    def bump(self, conn: Connection | None = None) -> int:
+        """Con `conn`, sube dentro de esa transacción (se ve al hacer commit)."""
+        stmt = (
+            pg_insert(DataGeneration)
+            .values(name=self.name, value=1)
+            .on_conflict_do_update(index_elements=[DataGeneration.name], set_={"value": DataGeneration.value + 1})
+            .returning(DataGeneration.value)
+        )
+        if conn is not None:
+            return conn.execute(stmt).scalar_one()
+        with self.bind.begin() as c:
+            return c.execute(stmt).scalar_one()
+
+
+generation = DbGeneration("data") if engine.dialect.name == "postgresql" else Generation("data")
+
+
+class GenerationCache:
+    """Caché por proceso válida mientras no cambie la generación de datos."""
+
+    def __init__(self, gen: Generation | DbGeneration = generation):
+        self.gen = gen
+        self._values: dict = {}
+        self._seen = -1
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, session: Session | None = None):
+        """`session`: la misma que usa `loader` (ver DbGeneration.current)."""
+        current = self.gen.current(session)
+        with self._lock:
+            if current != self._seen:
+                self._values.clear()
+                self._seen = current
+            if key in self._values:
+                return self._values[key]
+        value = loader()
+        with self._lock:
+            # si la generación cambió mientras cargábamos, no guardamos un valor viejo
+            if self.gen.current(session) == current == self._seen:
+                self._values[key] = value
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+# -------------------------- INVALIDACIÓN AUTOMÁTICA --------------------------
+@event.listens_for(Session, "after_flush")
+def _mark_changes(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info["bump_generation"] = True
+
+@event.listens_for(Session, "before_commit")
+def _bump_in_transaction(session):
+    # contador en la base: sube en la misma transacción que los cambios (sin
+    # pedir otra conexión al pool mientras esta sigue tomada)
+    if isinstance(generation, DbGeneration):
+        session.flush()
+        if session.info.pop("bump_generation", False):
+            generation.bump(session.connection())
+
+@event.listens_for(Session, "after_commit")
+def _bump_generation(session):
+    if session.info.pop("bump_generation", False):
+        generation.bump()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session):
+    session.info.pop("bump_generation", None)
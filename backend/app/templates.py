@@ -0,0 +1,171 @@
+# app/templates.py
+"""
+Registro de plantillas DOCX.
+
+Carga cada `*.docx` de TEMPLATES_DIR una sola vez, lo valida contra su esquema
+de tokens y lo deja compilado en memoria (XML decodificado, patrones regex y
+prefijo ZIP). Las peticiones sólo rellenan el XML: no hay I/O de archivos por
+request. Los cambios en el directorio se recargan en caliente cada
+TEMPLATES_RELOAD_SECONDS.
+
+Esquema de tokens: un `<nombre>.json` junto al DOCX con
+    {"description": "...", "tokens": ["&NOMBRE&", ...]}
+Si no existe, los tokens se descubren en el propio document.xml.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from io import BytesIO
+from zipfile import ZipFile
+
+from app.main_utils import (
+    compile_token_patterns, docx_prefix, docx_to_pdf_file, rebuild_docx, rebuild_docx_to_file, tolerant_replace,
+)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", os.path.join(BASE_DIR, "templates"))
+DEFAULT_TEMPLATE = os.getenv("DEFAULT_TEMPLATE", "orden")
+# 0 desactiva la recarga en caliente
+TEMPLATES_RELOAD_SECONDS = float(os.getenv("TEMPLATES_RELOAD_SECONDS", "2"))
+
+DOCUMENT_PATH = "word/document.xml"
+
+_tag_re = re.compile(r"<[^>]+>")
+_token_re = re.compile(r"&amp;\s*([A-Za-z0-9_]+)\s*&amp;")
+
+
+class TemplateNotFound(LookupError):
+    pass
+
+
+class CompiledTemplate:
+    def __init__(self, name: str, path: str, mtime: float, docx_bytes: bytes, schema: dict):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.docx_bytes = docx_bytes
+        self.description = schema.get("description", "")
+
+        with ZipFile(BytesIO(docx_bytes), "r") as z:
+            self.xml = z.read(DOCUMENT_PATH).decode("utf-8", errors="ignore")
+
+        # Texto plano del documento: los tokens pueden venir partidos entre runs
+        found = list(dict.fromkeys(f"&{t.upper()}&" for t in _token_re.findall(_tag_re.sub("", self.xml))))
+        declared = schema.get("tokens")
+        if declared:
+            missing = [t for t in declared if t not in found]
+            if missing:
+                raise ValueError(f"Plantilla '{name}': tokens declarados que no aparecen en el documento: {missing}")
+            self.tokens = list(declared)
+        else:
+            self.tokens = found
+
+        self.patterns = compile_token_patterns(self.tokens)
+        # miembros sin cambios ya comprimidos, una vez por versión de la plantilla
+        # (valida el ZIP; se va junto con la plantilla al recargarla)
+        self.prefix = docx_prefix(docx_bytes, DOCUMENT_PATH)
+
+    def fill(self, mapping: dict) -> bytes:
+        xml_new = tolerant_replace(self.xml, mapping, self.patterns)
+        return rebuild_docx(self.docx_bytes, xml_new.encode("utf-8"), DOCUMENT_PATH, self.prefix)
+
+    def render_pdf(self, mapping: dict, dest_path: str) -> str:
+        """Rellena y convierte de forma síncrona; el PDF queda en `dest_path` (.pdf)."""
+        docx_path = os.path.splitext(dest_path)[0] + ".docx"
+        xml_new = tolerant_replace(self.xml, mapping, self.patterns)
+        rebuild_docx_to_file(self.docx_bytes, xml_new.encode("utf-8"), docx_path, DOCUMENT_PATH, self.prefix)
+        try:
+            return docx_to_pdf_file(docx_path)
+        finally:
+            os.remove(docx_path)
+
+    def describe(self) -> dict:
+        return {"name": self.name, "description": self.description, "tokens": self.tokens}
+
+
+class TemplateRegistry:
+    def __init__(self, directory: str, reload_seconds: float = 0):
+        self.directory = directory
+        self.reload_seconds = reload_seconds
+        self._templates: dict[str, CompiledTemplate] = {}
+        self._lock = threading.Lock()
+        self._last_scan = 0.0
+
+    def _scan(self) -> dict[str, str]:
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return {}
+        return {
+            os.path.splitext(e)[0]: os.path.join(self.directory, e)
+            for e in entries
+            if e.lower().endswith(".docx") and not e.startswith("~$")
+        }
+
+    def _load(self, name: str, path: str, mtime: float) -> CompiledTemplate:
+        schema = {}
+        schema_path = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(schema_path):
+            with open(schema_path, "r", encoding="utf-8") as f:
+                schema = json.load(f)
+        with open(path, "rb") as f:
+            docx_bytes = f.read()
+        return CompiledTemplate(name, path, mtime, docx_bytes, schema)
+
+    def refresh(self) -> None:
+        """Recompila las plantillas nuevas o modificadas y olvida las borradas."""
+        with self._lock:
+            found = self._scan()
+            templates = {}
+            for name, path in found.items():
+                schema_path = os.path.splitext(path)[0] + ".json"
+                mtime = max(
+                    os.path.getmtime(path),
+                    os.path.getmtime(schema_path) if os.path.exists(schema_path) else 0,
+                )
+                current = self._templates.get(name)
+                if current and current.mtime == mtime:
+                    templates[name] = current
+                    continue
+                try:
+                    templates[name] = self._load(name, path, mtime)
+                    logger.info("Plantilla '%s' cargada (%d tokens)", name, len(templates[name].tokens))
+                except Exception:
+                    # una plantilla rota no debe tumbar las demás; se conserva la versión previa
+                    logger.exception("No se pudo cargar la plantilla '%s'", name)
+                    if current:
+                        templates[name] = current
+            self._templates = templates
+            self._last_scan = time.monotonic()
+
+    def _maybe_refresh(self) -> None:
+        if not self._last_scan:
+            self.refresh()
+        elif self.reload_seconds and time.monotonic() - self._last_scan >= self.reload_seconds:
+            self.refresh()
+
+    def get(self, name: str | None = None) -> CompiledTemplate:
+        self._maybe_refresh()
+        name = name or DEFAULT_TEMPLATE
+        try:
+            return self._templates[name]
+        except KeyError:
+            # el directorio sólo va al log: el mensaje puede llegar al cliente
+            logger.warning("plantilla %r no encontrada en %s", name, self.directory)
+            raise TemplateNotFound(f"No se encontró la plantilla '{name}'") from None
+
+    def names(self) -> list[str]:
+        self._maybe_refresh()
+        return sorted(self._templates)
+
+    def describe(self) -> list[dict]:
+        self._maybe_refresh()
+        return [self._templates[n].describe() for n in sorted(self._templates)]
+
+
+registry = TemplateRegistry(TEMPLATES_DIR, TEMPLATES_RELOAD_SECONDS)
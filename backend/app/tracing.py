@@ -0,0 +1,211 @@
+# app/tracing.py
+"""
+Trazas por petición del pipeline de PDFs, sin servicios externos.
+
+Cada petición a TRACE_PATHS abre una traza; el código marca sus etapas con
+
+    with span("upload"):
+        ...
+
+y al responder:
+  - la respuesta lleva `Server-Timing` (las devtools del navegador muestran el
+    desglose fill / repack / convert en la pestaña Timing), y
+  - si la traza quedó muestreada, se exporta como una línea JSON en el log
+    `app.tracing` y queda en un buffer circular en memoria (GET /pdf/traces).
+
+Medir cuesta casi nada, así que el muestreo sólo decide qué se exporta. Una
+petición con la cabecera `X-Trace: 1` se muestrea siempre.
+
+Configuración por entorno:
+  TRACE_PATHS          prefijos trazados, separados por coma (por defecto /pdf)
+  TRACE_SAMPLE_RATE    fracción de trazas exportadas, 0..1 (por defecto 1)
+  TRACE_BUFFER_SIZE    trazas que guarda el buffer de cada proceso
+  TRACE_LOG            1/0: línea JSON por traza muestreada en stderr
+  TRACE_SERVER_TIMING  1/0: cabecera Server-Timing en las respuestas
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+TRACE_PATHS = tuple(p.strip() for p in os.getenv("TRACE_PATHS", "/pdf").split(",") if p.strip())
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "1") == "1"
+
+# salida del soffice que se guarda por span
+MAX_ATTR_CHARS = 2000
+
+logger = logging.getLogger(__name__)
+if TRACE_LOG and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Span:
+    __slots__ = ("name", "parent", "start", "end", "attrs")
+
+    def __init__(self, name: str, parent: str | None, attrs: dict):
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+class Trace:
+    def __init__(self, name: str, sampled: bool):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.status: int | None = None
+        self.spans: list[Span] = []
+
+    def server_timing(self) -> str:
+        # una entrada por nombre de etapa (sumando si se repite) + el total hasta ahora
+        totals: dict[str, float] = {}
+        for s in self.spans:
+            if s.end is not None:
+                totals[s.name] = totals.get(s.name, 0.0) + s.duration
+        parts = [f"{name};dur={ms:.1f}" for name, ms in totals.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000, 2),
+            "spans": [
+                {
+                    "name": s.name,
+                    "parent": s.parent,
+                    "offset_ms": round((s.start - self.start) * 1000, 2),
+                    "duration_ms": round(s.duration, 2),
+                    **({"attrs": s.attrs} if s.attrs else {}),
+                }
+                for s in self.spans
+            ],
+        }
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("span", default=None)
+
+_buffer: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Mide un bloque dentro de la traza actual; fuera de una petición no hace nada."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    s = Span(name, parent.name if parent else None, attrs)
+    trace.spans.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = str(e)[:MAX_ATTR_CHARS] or type(e).__name__
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def annotate(name: str, **attrs) -> None:
+    """Agrega atributos al último span `name` de la traza actual (p. ej. salida de soffice)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    for s in reversed(trace.spans):
+        if s.name == name:
+            s.attrs.update({k: v[:MAX_ATTR_CHARS] if isinstance(v, str) else v for k, v in attrs.items()})
+            return
+
+
+def export(trace: Trace) -> None:
+    data = trace.as_dict()
+    with _buffer_lock:
+        _buffer.append(data)
+    if TRACE_LOG:
+        logger.info(json.dumps(data, ensure_ascii=False))
+
+
+def recent(limit: int = 50, min_ms: float = 0.0) -> list[dict]:
+    """Trazas del buffer de este proceso, de la más nueva a la más vieja."""
+    with _buffer_lock:
+        items = list(_buffer)
+    items.reverse()
+    return [t for t in items if t["duration_ms"] >= min_ms][:limit]
+
+
+def find(trace_id: str) -> dict | None:
+    with _buffer_lock:
+        return next((t for t in _buffer if t["trace_id"] == trace_id), None)
+
+
+class TracingMiddleware:
+    """Middleware ASGI puro: no envuelve el cuerpo (los FileResponse siguen en streaming)."""
+
+    def __init__(self, app, paths: tuple = TRACE_PATHS, sample_rate: float = TRACE_SAMPLE_RATE,
+                 exclude: tuple = ("/pdf/traces",)):
+        self.app = app
+        self.paths = paths
+        self.sample_rate = sample_rate
+        # consultar las trazas no debe llenar el buffer de trazas
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths) or scope["path"].startswith(self.exclude):
+            return await self.app(scope, receive, send)
+
+        forced = any(k == b"x-trace" and v == b"1" for k, v in scope.get("headers", ()))
+        trace = Trace(f'{scope["method"]} {scope["path"]}', forced or random.random() < self.sample_rate)
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = list(message.get("headers", []))
+                if TRACE_SERVER_TIMING:
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    # sin esto el navegador oculta Server-Timing a un frontend en otro origen
+                    headers.append((b"timing-allow-origin", b"*"))
+                if trace.sampled:
+                    headers.append((b"x-trace-id", trace.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            trace.end = time.perf_counter()
+            if trace.sampled:
+                export(trace)
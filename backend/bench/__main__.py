@@ -0,0 +1,124 @@
+# bench/__main__.py
+"""
+Benchmarks de extremo a extremo del pipeline de PDFs y de las órdenes.
+
+Uso (desde backend/):
+  python -m bench run --out bench-base.json          # corre todo y guarda JSON
+  python -m bench run --only micro --quick           # sólo microbenchmarks, corrida corta
+  python -m bench compare bench-base.json bench-new.json --threshold 0.10
+
+`compare` marca como regresión cualquier métrica de tiempo que empeore más
+que el umbral (o throughput que baje más que el umbral) y sale con código 1.
+Si LibreOffice no está instalado se usa un soffice falso.
+"""
+import argparse
+import json
+import platform
+import shutil
+import sys
+import time
+
+from bench.fixtures import make_workdir, seed_orders, setup_env
+
+# métricas que se comparan: (nombre, mayor_es_mejor)
+COMPARED = [("median", False), ("p95", False), ("rps", True)]
+
+
+def cmd_run(args) -> int:
+    workdir = make_workdir()
+    try:
+        return _run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run(args, workdir: str) -> int:
+    env = setup_env(workdir, render_workers=args.workers)
+    seed_orders(args.orders)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "soffice": env["soffice"],
+            "render_workers": args.workers,
+            "seeded_orders": args.orders,
+            "quick": args.quick,
+        },
+        "benchmarks": {},
+    }
+    if args.only in (None, "micro"):
+        from bench import micro
+        print("micro:")
+        results["benchmarks"].update({f"micro:{k}": v for k, v in micro.run(args.quick).items()})
+    if args.only in (None, "routes"):
+        from bench import routes
+        print("routes:")
+        results["benchmarks"].update({f"route:{k}": v for k, v in routes.run(args.quick).items()})
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"resultados en {args.out}")
+    return 0
+
+
+def compare(base: dict, new: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, b in base["benchmarks"].items():
+        n = new["benchmarks"].get(name)
+        if n is None:
+            continue
+        for metric, higher_is_better in COMPARED:
+            if metric not in b or metric not in n or not b[metric]:
+                continue
+            change = (n[metric] - b[metric]) / b[metric]
+            worse = -change if higher_is_better else change
+            flag = "REGRESIÓN" if worse > threshold else ""
+            print(f"  {name:<42} {metric:<7} {b[metric]:>12.2f} -> {n[metric]:>12.2f}  {change:+7.1%} {flag}")
+            if flag:
+                regressions.append(f"{name} {metric}")
+    return regressions
+
+
+def cmd_compare(args) -> int:
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regresiones por encima de {args.threshold:.0%}:")
+        for r in regressions:
+            print(f"  - {r}")
+        return 1
+    print("sin regresiones")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="corre los benchmarks")
+    p_run.add_argument("--out", help="archivo JSON de resultados")
+    p_run.add_argument("--only", choices=["micro", "routes"])
+    p_run.add_argument("--quick", action="store_true", help="menos repeticiones (humo)")
+    p_run.add_argument("--orders", type=int, default=500, help="órdenes sembradas en la DB")
+    p_run.add_argument("--workers", type=int, default=0, help="RENDER_WORKERS para las rutas")
+    p_run.set_defaults(func=cmd_run)
+
+    p_cmp = sub.add_parser("compare", help="compara dos corridas")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10)
+    p_cmp.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
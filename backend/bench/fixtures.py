@@ -0,0 +1,157 @@
+# bench/fixtures.py
+"""
+Datos sintéticos y entorno aislado para los benchmarks.
+
+Todo es determinista (semilla fija) para que dos corridas sean comparables.
+"""
+import os
+import random
+import shutil
+import stat
+import tempfile
+from io import BytesIO
+
+SEED = 42
+
+NOMBRES = ["Ana López", "Luis Pérez", "María García", "José Hernández", "Carmen Ruiz"]
+DESTINOS = ["Cantaritos El Güero, Amatitán", "Tequila centro", "Chapala", "Tlaquepaque", "Tapalpa"]
+SALIDAS = ["Av. Vallarta 1500, Guadalajara", "Plaza del Sol, Zapopan", "Centro, Tlaquepaque"]
+HORAS = ["9:00 am", "10:30 a.m.", "13:00", "2:15 pm", "17:33:00 am", "8 pm"]
+
+FAKE_SOFFICE = """#!/bin/sh
+# soffice falso para benchmarks: copia el DOCX como "PDF"
+while [ $# -gt 0 ]; do
+  case "$1" in
+    --outdir) out="$2"; shift ;;
+    *.docx) in="$1" ;;
+  esac
+  shift
+done
+b=$(basename "$in" .docx)
+printf '%%PDF-1.4\\n' > "$out/$b.pdf"
+cat "$in" >> "$out/$b.pdf"
+"""
+
+
+def setup_env(workdir: str, render_workers: int = 0) -> dict:
+    """
+    Prepara variables de entorno ANTES de importar `app`: base SQLite propia
+    y un soffice falso en el PATH si LibreOffice no está instalado.
+    """
+    info = {"soffice": "real"}
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["RENDER_WORKERS"] = str(render_workers)
+    os.environ["ARTIFACTS_DIR"] = os.path.join(workdir, "artifacts")
+    # el pre-render competiría con las peticiones medidas
+    os.environ.setdefault("PRERENDER_ENABLED", "0")
+    # una línea JSON por PDF ensuciaría la salida del benchmark
+    os.environ.setdefault("TRACE_LOG", "0")
+    os.environ.setdefault("RENDER_MAX_PENDING", "1000")
+    if shutil.which("soffice") is None:
+        bindir = os.path.join(workdir, "bin")
+        os.makedirs(bindir, exist_ok=True)
+        path = os.path.join(bindir, "soffice")
+        with open(path, "w") as f:
+            f.write(FAKE_SOFFICE)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        os.environ["PATH"] = bindir + os.pathsep + os.environ.get("PATH", "")
+        info["soffice"] = "mock"
+    return info
+
+
+def make_workdir() -> str:
+    return tempfile.mkdtemp(prefix="mt-bench-")
+
+
+def order_row(rng: random.Random) -> dict:
+    subtotal = rng.choice([2500, 4500, 5500, 9500])
+    descuento = rng.choice([0, 0, subtotal * 0.10])
+    abonado = rng.choice([0, 500, 1000])
+    return {
+        "Nombre": rng.choice(NOMBRES),
+        "Fecha": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "Dir Salida": rng.choice(SALIDAS),
+        "Dir Destino": rng.choice(DESTINOS),
+        "Hor Ida": rng.choice(HORAS),
+        "Hor Regreso": rng.choice(HORAS),
+        "Duracion": str(rng.randint(2, 10)),
+        "CapacidadU": str(rng.choice([6, 14, 20, 45])),
+        "Subtotal": f"{subtotal:,.2f}",
+        "Descuento": f"{descuento:,.2f}",
+        "Abonado": f"{abonado:,.2f}",
+        "Fecha Abono": "",
+    }
+
+
+def make_workbook(rows: int = 1, seed: int = SEED) -> bytes:
+    import pandas as pd
+
+    rng = random.Random(seed)
+    buf = BytesIO()
+    pd.DataFrame([order_row(rng) for _ in range(rows)]).to_excel(buf, index=False, sheet_name="Orden")
+    return buf.getvalue()
+
+
+def fixed_mapping() -> dict:
+    return {
+        "&NOMBRE&": "Ana López",
+        "&FECHA&": "2026-11-01",
+        "&DIR_SALIDA&": "Av. Vallarta 1500, Guadalajara",
+        "&DIR_DESTINO&": "Cantaritos El Güero, Amatitán",
+        "&HOR_IDA&": "10:00 am",
+        "&HOR_REGRESO&": "6:00 pm",
+        "&DURACION&": "8",
+        "&CAPACIDADU&": "14",
+        "&SUBTOTAL&": "5000.00",
+        "&DESCUENTO&": "0.00",
+        "&ABONADO&": "1000.00",
+        "&FECHA_ABONO&": "2026-10-20",
+        "&TOTAL&": "5000.00",
+        "&LIQUIDAR&": "4000.00",
+    }
+
+
+def form_payload(rng: random.Random) -> dict:
+    return {
+        "nombre": rng.choice(NOMBRES),
+        "fecha": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "direccion_salida": rng.choice(SALIDAS),
+        "destino": rng.choice(DESTINOS),
+        "hora_salida": rng.choice(HORAS),
+        "hora_regreso": rng.choice(HORAS),
+        "personas": str(rng.randint(1, 45)),
+        "nonce": rng.random(),  # evita que la idempotencia deduplique el benchmark
+    }
+
+
+def seed_orders(count: int, seed: int = SEED) -> None:
+    """Llena la tabla orders con `count` órdenes sintéticas."""
+    from app.database import Base, SessionLocal, engine
+    from app.models import Order
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        db.query(Order).delete()
+        for _ in range(count):
+            subtotal = rng.choice([2500.0, 4500.0, 5500.0, 9500.0])
+            db.add(Order(
+                nombre=rng.choice(NOMBRES),
+                fecha=f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                dir_salida=rng.choice(SALIDAS),
+                dir_destino=rng.choice(DESTINOS),
+                hor_ida=rng.choice(HORAS),
+                hor_regreso=rng.choice(HORAS),
+                duracion=str(rng.randint(2, 10)),
+                capacidadu=str(rng.choice([6, 14, 20, 45])),
+                subtotal=subtotal,
+                descuento=0.0,
+                total=subtotal,
+                abonado=0.0,
+                fecha_abono=None,
+                liquidar=subtotal,
+            ))
+        db.commit()
+    finally:
+        db.close()
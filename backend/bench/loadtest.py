@@ -0,0 +1,355 @@
+# bench/loadtest.py
+"""
+Generador de carga contra un uvicorn local (HTTP real, sólo stdlib).
+
+Simula ráfagas de Google Forms sobre /orders/form-submit mientras los
+administradores suben Excels a /pdf/from-excel y consultan /orders.
+
+Uso (desde backend/):
+  python -m bench.loadtest --spawn                          # levanta uvicorn con DB temporal
+  python -m bench.loadtest --base-url http://127.0.0.1:8000 --scenario mixed
+  python -m bench.loadtest --spawn --scenarios-file mis_escenarios.json --out carga.json
+
+Un escenario es:
+  {"duration": 20, "concurrency": 4,
+   "mix": {"form_submit": 6, "list_orders": 3, "upload_excel": 1, "pdf_from_data": 0},
+   "burst": {"every": 8, "length": 3, "concurrency": 24}}
+`burst` añade, durante `length` segundos cada `every`, hilos extra que sólo
+envían formularios (como Apps Script disparando reintentos en bloque).
+
+Por escenario y por acción reporta throughput, p50/p95/p99, tasa de error y
+errores "database is locked" de SQLite (en la respuesta o, con --spawn, en
+el log del servidor).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from bench.fixtures import DESTINOS, NOMBRES, SALIDAS, make_workbook, setup_env
+
+# Formatos que de verdad llegan desde el formulario
+HORAS_SALIDA = [
+    "9:00 am", "9:30 a.m.", "10:00 AM", "11:15 a. m.", "1:00 pm", "2:30 p.m.",
+    "13:00", "14:45:00", "17:33:00 am", "8 pm", "07:00", "6:00:00 p.m.",
+]
+CANTARITOS = ["Cantaritos El Güero, Amatitán", "Cantaritos Tequila", "Amatitlan plaza", "Tequila, Jal."]
+
+SCENARIOS = {
+    "forms-burst": {
+        "duration": 20, "concurrency": 2,
+        "mix": {"form_submit": 1},
+        "burst": {"every": 6, "length": 2, "concurrency": 32},
+    },
+    "admin": {
+        "duration": 20, "concurrency": 4,
+        "mix": {"list_orders": 6, "upload_excel": 2, "pdf_from_data": 2},
+    },
+    "mixed": {
+        "duration": 30, "concurrency": 6,
+        "mix": {"form_submit": 4, "list_orders": 4, "upload_excel": 1, "pdf_from_data": 1},
+        "burst": {"every": 10, "length": 3, "concurrency": 24},
+    },
+}
+
+LOCK_MARKER = b"database is locked"
+
+
+# -------------------------- CLIENTE --------------------------
+class Client:
+    """Una conexión keep-alive por hilo."""
+
+    def __init__(self, base_url: str, timeout: float):
+        u = urlsplit(base_url)
+        self.host, self.port = u.hostname, u.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method: str, path: str, headers: dict, body: bytes = b"") -> tuple[int, bytes]:
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body or None, headers=headers)
+                resp = self.conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, ConnectionError, socket.timeout):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        raise RuntimeError("inalcanzable")
+
+
+def login(base_url: str, user: str, password: str) -> str:
+    c = Client(base_url, 30)
+    body = urlencode({"username": user, "password": password}).encode()
+    status, data = c.request("POST", "/auth/login", {"Content-Type": "application/x-www-form-urlencoded"}, body)
+    if status != 200:
+        raise SystemExit(f"login falló ({status}): {data[:200]!r}")
+    return json.loads(data)["access_token"]
+
+
+# -------------------------- ACCIONES --------------------------
+class Actions:
+    def __init__(self, api_key: str, token: str, workbook: bytes):
+        self.api_key = api_key
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.workbook = workbook
+
+    def form_submit(self, rng: random.Random):
+        destino = rng.choice(CANTARITOS) if rng.random() < 0.4 else rng.choice(DESTINOS)
+        payload = {
+            "nombre": rng.choice(NOMBRES),
+            "fecha": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "direccion_salida": rng.choice(SALIDAS),
+            "destino": destino,
+            "hora_salida": rng.choice(HORAS_SALIDA),
+            "hora_regreso": rng.choice(HORAS_SALIDA),
+            "personas": str(rng.randint(1, 45)),
+        }
+        headers = {"Content-Type": "application/json", "x-api-key": self.api_key}
+        # ~20% son reintentos de Apps Script con la misma llave
+        key = f"burst-{rng.randint(0, 50)}" if rng.random() < 0.2 else uuid.uuid4().hex
+        headers["Idempotency-Key"] = key
+        return "POST", "/orders/form-submit", headers, json.dumps(payload).encode()
+
+    def list_orders(self, rng: random.Random):
+        return "GET", "/orders", dict(self.auth), b""
+
+    def upload_excel(self, rng: random.Random):
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="sheet"\r\n\r\nOrden\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="orden.xlsx"\r\n'
+            f"Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n"
+        ).encode() + self.workbook + f"\r\n--{boundary}--\r\n".encode()
+        headers = {**self.auth, "Content-Type": f"multipart/form-data; boundary={boundary}"}
+        return "POST", "/pdf/from-excel", headers, body
+
+    def pdf_from_data(self, rng: random.Random):
+        payload = {
+            "nombre": rng.choice(NOMBRES), "fecha": "2026-11-01",
+            "dir_salida": rng.choice(SALIDAS), "dir_destino": rng.choice(CANTARITOS),
+            "hor_ida": rng.choice(HORAS_SALIDA), "hor_regreso": rng.choice(HORAS_SALIDA),
+            "subtotal": "5,000.00", "abonado": "1000",
+        }
+        return "POST", "/pdf/from-data", {**self.auth, "Content-Type": "application/json"}, json.dumps(payload).encode()
+
+
+# -------------------------- ESCENARIO --------------------------
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.locked: dict[str, int] = {}
+
+    def add(self, action: str, ms: float, ok: bool, locked: bool):
+        with self.lock:
+            self.samples.setdefault(action, []).append(ms)
+            if not ok:
+                self.errors[action] = self.errors.get(action, 0) + 1
+            if locked:
+                self.locked[action] = self.locked.get(action, 0) + 1
+
+
+def summarize(samples: list[float], errors: int, locked: int, elapsed: float) -> dict:
+    s = sorted(samples)
+    n = len(s)
+
+    def pct(p):
+        return s[min(n - 1, int(n * p))] if n else 0.0
+
+    return {
+        "requests": n,
+        "rps": n / elapsed if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": s[-1] if n else 0.0,
+        "errors": errors,
+        "error_rate": errors / n if n else 0.0,
+        "sqlite_locked": locked,
+    }
+
+
+def run_scenario(name: str, spec: dict, base_url: str, actions: Actions, timeout: float, seed: int) -> dict:
+    mix = {k: v for k, v in spec.get("mix", {}).items() if v > 0}
+    names, weights = list(mix), list(mix.values())
+    burst = spec.get("burst")
+    rec = Recorder()
+    start = time.monotonic()
+    deadline = start + spec.get("duration", 20)
+
+    def in_burst(now: float) -> bool:
+        if not burst:
+            return False
+        return (now - start) % burst["every"] < burst["length"]
+
+    def fire(client: Client, rng: random.Random, action: str):
+        method, path, headers, body = getattr(actions, action)(rng)
+        t0 = time.perf_counter()
+        try:
+            status, data = client.request(method, path, headers, body)
+            ok, locked = status < 400, LOCK_MARKER in data
+        except Exception as e:
+            ok, locked = False, LOCK_MARKER in str(e).encode()
+        rec.add(action, (time.perf_counter() - t0) * 1000, ok, locked)
+
+    def base_worker(i: int):
+        client, rng = Client(base_url, timeout), random.Random(seed + i)
+        while time.monotonic() < deadline:
+            fire(client, rng, rng.choices(names, weights)[0])
+
+    def burst_worker(i: int):
+        client, rng = Client(base_url, timeout), random.Random(seed + 1000 + i)
+        while (now := time.monotonic()) < deadline:
+            if in_burst(now):
+                fire(client, rng, "form_submit")
+            else:
+                time.sleep(0.02)
+
+    threads = [threading.Thread(target=base_worker, args=(i,)) for i in range(spec.get("concurrency", 4) if names else 0)]
+    if burst:
+        threads += [threading.Thread(target=burst_worker, args=(i,)) for i in range(burst["concurrency"])]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    per_action = {
+        a: summarize(rec.samples[a], rec.errors.get(a, 0), rec.locked.get(a, 0), elapsed)
+        for a in sorted(rec.samples)
+    }
+    all_samples = [ms for v in rec.samples.values() for ms in v]
+    total = summarize(all_samples, sum(rec.errors.values()), sum(rec.locked.values()), elapsed)
+    return {"scenario": name, "spec": spec, "elapsed_s": elapsed, "total": total, "actions": per_action}
+
+
+def print_report(result: dict) -> None:
+    print(f"\n== {result['scenario']} ({result['elapsed_s']:.1f}s) ==")
+    print(f"  {'acción':<16}{'req':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>8}{'locked':>8}")
+    rows = list(result["actions"].items()) + [("TOTAL", result["total"])]
+    for action, r in rows:
+        print(
+            f"  {action:<16}{r['requests']:>7}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+            f"{r['p99_ms']:>9.1f}{r['error_rate']:>8.1%}{r['sqlite_locked']:>8}"
+        )
+    if "server_locked" in result:
+        print(f"  'database is locked' en el log del servidor: {result['server_locked']}")
+
+
+# -------------------------- SERVIDOR LOCAL --------------------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(workdir: str, workers: int, log_level: str = "warning") -> tuple[subprocess.Popen, str, str]:
+    """Levanta uvicorn con DB temporal; stderr va a un log para contar locks."""
+    setup_env(workdir, render_workers=int(os.getenv("RENDER_WORKERS", "2")))
+    port = free_port()
+    log_path = os.path.join(workdir, "server.log")
+    log = open(log_path, "wb")
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", log_level]
+    proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=os.environ.copy())
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            status, _ = Client(base_url, 1).request("GET", "/health", {})
+            if status == 200:
+                return proc, base_url, log_path
+        except OSError:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.1)
+    proc.terminate()
+    with open(log_path, "rb") as f:
+        sys.stderr.write(f.read().decode("utf-8", errors="ignore"))
+    raise SystemExit("uvicorn no arrancó")
+
+
+def count_locks(log_path: str) -> int:
+    with open(log_path, "rb") as f:
+        return f.read().count(LOCK_MARKER)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.loadtest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="levanta un uvicorn local con DB temporal")
+    parser.add_argument("--server-workers", type=int, default=1, help="--workers de uvicorn con --spawn")
+    parser.add_argument("--scenario", action="append", help=f"escenarios a correr (por defecto: {', '.join(SCENARIOS)})")
+    parser.add_argument("--scenarios-file", help="JSON {nombre: escenario} que se suma a los incluidos")
+    parser.add_argument("--duration", type=float, help="sobrescribe la duración de cada escenario")
+    parser.add_argument("--api-key", default=os.getenv("FORM_API_KEY", "super-secret-key"))
+    parser.add_argument("--user", default=os.getenv("ADMIN_USER", "admin"))
+    parser.add_argument("--password", default=os.getenv("ADMIN_PASS", "mtcolectivo123"))
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="guarda los resultados en JSON")
+    args = parser.parse_args(argv)
+
+    scenarios = dict(SCENARIOS)
+    if args.scenarios_file:
+        with open(args.scenarios_file, encoding="utf-8") as f:
+            scenarios.update(json.load(f))
+    selected = args.scenario or list(scenarios)
+    unknown = [s for s in selected if s not in scenarios]
+    if unknown:
+        raise SystemExit(f"escenarios desconocidos: {unknown}")
+
+    workdir = tempfile.mkdtemp(prefix="mt-load-")
+    proc = log_path = None
+    try:
+        base_url = args.base_url
+        if args.spawn:
+            proc, base_url, log_path = spawn_server(workdir, args.server_workers)
+            print(f"uvicorn en {base_url} (log: {log_path})")
+
+        actions = Actions(args.api_key, login(base_url, args.user, args.password), make_workbook())
+        results = []
+        for name in selected:
+            spec = dict(scenarios[name])
+            if args.duration:
+                spec["duration"] = args.duration
+            locks_before = count_locks(log_path) if log_path else 0
+            result = run_scenario(name, spec, base_url, actions, args.timeout, args.seed)
+            if log_path:
+                result["server_locked"] = count_locks(log_path) - locks_before
+            print_report(result)
+            results.append(result)
+
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump({"base_url": base_url, "results": results}, f, indent=2)
+            print(f"\nresultados en {args.out}")
+        return 0
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# bench/micro.py
+"""Microbenchmarks de las utilidades del pipeline de PDFs."""
+import statistics
+import time
+
+from bench.fixtures import fixed_mapping, make_workbook
+
+
+def measure(fn, repeat: int = 20, number: int = 5) -> dict:
+    """Corre `fn` repeat×number veces y resume el tiempo por operación (µs)."""
+    fn()  # calentamiento (cachés, imports perezosos)
+    samples = []
+    cpu0 = time.process_time()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number * 1e6)
+    cpu = (time.process_time() - cpu0) / (repeat * number) * 1e6
+    samples.sort()
+    return {
+        "unit": "us/op",
+        "ops": repeat * number,
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "cpu": cpu,
+    }
+
+
+def run(quick: bool = False) -> dict:
+    import gzip
+    import json
+    from io import BytesIO
+
+    import brotli
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+
+    import pandas as pd
+
+    from app.main_utils import (
+        apply_totals,
+        apply_totals_frame,
+        build_mapping_from_row,
+        generate_pdf_from_template,
+        header_plan,
+        read_first_row_from_excel,
+        rebuild_docx,
+        tolerant_replace,
+    )
+    from app.compression import COMPRESS_BROTLI_QUALITY, COMPRESS_GZIP_LEVEL
+    from app.database import SessionLocal
+    from app.models import Order
+    from app.routers.orders import orders_json, serialize_order
+    from app.templates import registry
+
+    repeat, number = (5, 2) if quick else (20, 5)
+    tpl = registry.get()
+    mapping = fixed_mapping()
+    xml_bytes = tolerant_replace(tpl.xml, mapping, tpl.patterns).encode("utf-8")
+    workbook = make_workbook()
+    row = read_first_row_from_excel(workbook, sheet_name="Orden")
+    # hoja de importación masiva: mismas columnas que el Excel de una orden
+    sheet = pd.read_excel(BytesIO(make_workbook(1000)), sheet_name="Orden", dtype=str)
+
+    def clean_cell(v):
+        # limpieza celda por celda (como antes de HeaderPlan), como referencia
+        if not isinstance(v, str):
+            return ""
+        v = v.strip()
+        if v.replace(",", "").replace(".", "", 1).isdigit():
+            v = str(float(v.replace(",", "")))
+        return v
+
+    def import_per_row():
+        for r in sheet.to_dict("records"):
+            apply_totals(build_mapping_from_row({k: clean_cell(v) for k, v in r.items()}))
+
+    def import_vectorized():
+        frame = header_plan(tuple(sheet.columns)).frame(sheet)
+        apply_totals_frame(frame)
+
+    db = SessionLocal()
+    list_adapter = TypeAdapter(list[dict])
+
+    def orders_list_orm():
+        # camino anterior de GET /orders: objetos Order -> dicts -> validación
+        # contra response_model -> jsonable_encoder -> json.dumps (JSONResponse)
+        data = [serialize_order(o) for o in db.query(Order).order_by(Order.id.desc()).all()]
+        data = jsonable_encoder(list_adapter.validate_python(data))
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    orders_body = orders_json(db)
+
+    cases = {
+        "tolerant_replace": lambda: tolerant_replace(tpl.xml, mapping, tpl.patterns),
+        "tolerant_replace_uncompiled": lambda: tolerant_replace(tpl.xml, mapping),
+        "rebuild_docx": lambda: rebuild_docx(tpl.docx_bytes, xml_bytes, prefix=tpl.prefix),
+        "template_fill": lambda: tpl.fill(mapping),
+        "read_first_row_from_excel": lambda: read_first_row_from_excel(workbook, sheet_name="Orden"),
+        "build_mapping_from_row": lambda: build_mapping_from_row(row),
+        "generate_pdf_from_template": lambda: generate_pdf_from_template(mapping),
+        "import_1000_rows_per_row": import_per_row,
+        "import_1000_rows_vectorized": import_vectorized,
+        "orders_list_orm_json": orders_list_orm,
+        "orders_list_orjson": lambda: orders_json(db),
+        "orders_list_gzip": lambda: gzip.compress(orders_body, COMPRESS_GZIP_LEVEL),
+        "orders_list_br": lambda: brotli.compress(orders_body, quality=COMPRESS_BROTLI_QUALITY),
+    }
+    # bytes que produce cada caso del listado de órdenes
+    sizes = {
+        "orders_list_orm_json": len(orders_list_orm()),
+        "orders_list_orjson": len(orders_body),
+        "orders_list_gzip": len(gzip.compress(orders_body, COMPRESS_GZIP_LEVEL)),
+        "orders_list_br": len(brotli.compress(orders_body, quality=COMPRESS_BROTLI_QUALITY)),
+    }
+    results = {}
+    try:
+        for name, fn in cases.items():
+            results[name] = measure(fn, repeat, number)
+            extra = ""
+            if name in sizes:
+                results[name]["bytes"] = sizes[name]
+                extra = f"  {sizes[name]:>9} bytes"
+            print(f"  {name:<30} median {results[name]['median']:>10.1f} us/op{extra}")
+    finally:
+        db.close()
+    return results
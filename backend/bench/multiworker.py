@@ -0,0 +1,102 @@
+# bench/multiworker.py
+"""
+Verificación del modo multi-worker.
+
+Levanta `uvicorn --workers N` sobre una base SQLite temporal y comprueba que:
+  1. los N workers arrancan (las migraciones no chocan entre sí);
+  2. después de cada escritura, todas las réplicas devuelven la misma lista
+     de órdenes (la caché por proceso se invalida entre procesos).
+
+Uso (desde backend/):
+  python -m bench.multiworker --workers 4 --writes 20
+Sale con código 1 si encuentra una inconsistencia.
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.loadtest import Client, login, spawn_server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.multiworker", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=20, help="escrituras a verificar")
+    parser.add_argument("--reads", type=int, default=24, help="lecturas por escritura (conexión nueva cada una)")
+    parser.add_argument("--api-key", default="super-secret-key")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="mt-multi-")
+    proc = None
+    failures = []
+    try:
+        proc, base_url, log_path = spawn_server(workdir, args.workers, log_level="info")
+        # espera a que todos los workers terminen su arranque
+        for _ in range(300):
+            with open(log_path, "rb") as f:
+                started = f.read().count(b"Application startup complete")
+            if started >= args.workers:
+                break
+            time.sleep(0.1)
+        print(f"{started}/{args.workers} workers arrancaron")
+        if started < args.workers:
+            failures.append("no arrancaron todos los workers")
+
+        auth = {"Authorization": f"Bearer {login(base_url, 'admin', 'mtcolectivo123')}"}
+
+        def read_orders(_):
+            # conexión nueva => el kernel reparte entre workers
+            status, body = Client(base_url, 30).request("GET", "/orders", auth)
+            return json.loads(body) if status == 200 else None
+
+        def check(expected_count: int, label: str, predicate=None):
+            with ThreadPoolExecutor(8) as ex:
+                seen = list(ex.map(read_orders, range(args.reads)))
+            bad = [s for s in seen if s is None or len(s) != expected_count or (predicate and not predicate(s))]
+            if bad:
+                failures.append(f"{label}: {len(bad)}/{len(seen)} lecturas inconsistentes")
+
+        check(0, "inicio")
+        client = Client(base_url, 30)
+        headers = {"Content-Type": "application/json", "x-api-key": args.api_key}
+        last_id = None
+        for i in range(args.writes):
+            payload = {"nombre": f"Cliente {i}", "personas": "10", "hora_salida": "9:00 am",
+                       "hora_regreso": "5:00 pm", "destino": "Chapala", "fecha": "2026-11-01"}
+            status, body = client.request("POST", "/orders/form-submit",
+                                          {**headers, "Idempotency-Key": uuid.uuid4().hex},
+                                          json.dumps(payload).encode())
+            last_id = json.loads(body)["order_id"]
+            check(i + 1, f"tras la escritura {i + 1}")
+
+        # una actualización (no inserción) también debe verse en todas las réplicas
+        client.request("POST", f"/orders/{last_id}/toggle-discount", auth)
+        check(args.writes, "tras toggle-discount",
+              lambda orders: next(o for o in orders if o["id"] == last_id)["descuento"] > 0)
+
+        with open(log_path, "rb") as f:
+            log = f.read()
+        if b"Traceback" in log:
+            failures.append("hubo excepciones en el log del servidor")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        for f in failures:
+            print(f"FALLA: {f}")
+        return 1
+    print(f"OK: {args.writes} escrituras consistentes en {args.workers} workers")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
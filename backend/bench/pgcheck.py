@@ -0,0 +1,205 @@
+# bench/pgcheck.py
+"""
+Verificación de la capa de datos contra PostgreSQL.
+
+Usa un PostgreSQL embebido (paquete `pgserver`, sin Docker) o uno ya
+levantado, p. ej. con `docker compose --profile postgres up` (--url), y
+comprueba que:
+  1. run_migrations crea el esquema, es idempotente y agrega columnas faltantes;
+  2. app.dbcopy copia una app.db SQLite sembrada y ajusta las secuencias
+     (el siguiente INSERT no choca con los ids copiados);
+  3. cada conexión trae statement_timeout y una consulta más lenta se cancela;
+  4. reintentos concurrentes de form-submit con la misma Idempotency-Key
+     crean una sola orden;
+  5. dos réplicas con STATE_DIR distintos (como dos hosts) ven las
+     escrituras de la otra en GET /orders (generación guardada en la base);
+     una de ellas corre con un pool de UNA conexión, así que una petición
+     que necesite dos se queda esperando y falla.
+
+Uso (desde backend/):
+  python -m bench.pgcheck                      # PostgreSQL embebido (pip install pgserver)
+  python -m bench.pgcheck --url postgresql+psycopg://mt:mt@localhost:5432/mtcolectivo
+¡Con --url se borran las tablas de esa base! Sale con código 1 si algo falla.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.loadtest import Client, free_port, login
+
+
+def embedded_url(pgdata: str):
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit("falta pgserver (pip install pgserver) o usa --url")
+    server = pgserver.get_server(pgdata, cleanup_mode="stop")
+    server.psql("DROP DATABASE IF EXISTS mtcheck;")
+    server.psql("CREATE DATABASE mtcheck;")
+    return server, server.get_uri("mtcheck").replace("postgresql://", "postgresql+psycopg://", 1)
+
+
+def spawn_replica(workdir: str, url: str, name: str, **extra_env) -> tuple[subprocess.Popen, str]:
+    """Un uvicorn contra `url` con su propio STATE_DIR (otro "host")."""
+    state_dir = os.path.join(workdir, f"state-{name}")
+    os.makedirs(state_dir, exist_ok=True)
+    env = {**os.environ, "DATABASE_URL": url, "STATE_DIR": state_dir, "RENDER_WORKERS": "0",
+           "PRERENDER_ENABLED": "0", "TRACE_LOG": "0", **extra_env}
+    port = free_port()
+    log = open(os.path.join(workdir, f"{name}.log"), "wb")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning"],
+                            stdout=log, stderr=subprocess.STDOUT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if Client(base_url, 1).request("GET", "/health", {})[0] == 200:
+                return proc, base_url
+        except OSError:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit(f"la réplica {name} no arrancó (ver {log.name})")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.pgcheck", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="PostgreSQL ya levantado (si no, uno embebido con pgserver)")
+    parser.add_argument("--orders", type=int, default=2500, help="órdenes en la app.db a copiar")
+    parser.add_argument("--retries", type=int, default=8, help="reintentos concurrentes de form-submit")
+    parser.add_argument("--statement-timeout-ms", type=int, default=500)
+    parser.add_argument("--api-key", default="super-secret-key")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="mt-pgcheck-")
+    server = None
+    replicas = []
+    failures = []
+
+    def check(ok: bool, label: str):
+        print(f"  {'ok   ' if ok else 'FALLA'} {label}")
+        if not ok:
+            failures.append(label)
+
+    try:
+        url = args.url
+        if url is None:
+            server, url = embedded_url(os.path.join(workdir, "pgdata"))
+        # antes de importar app: la base del proceso es la app.db de origen
+        source_url = f"sqlite:///{os.path.join(workdir, 'app.db')}"
+        os.environ["DATABASE_URL"] = source_url
+        os.environ["STATE_DIR"] = workdir
+        os.environ["DB_STATEMENT_TIMEOUT_MS"] = str(args.statement_timeout_ms)
+
+        from sqlalchemy import create_engine, func, select, text
+        from sqlalchemy.exc import OperationalError
+        from sqlalchemy.orm import Session
+
+        from app import dbcopy
+        from app.database import Base, engine_kwargs
+        from app.migrations import run_migrations
+        from app.models import Order
+        from bench.fixtures import seed_orders
+
+        pg = create_engine(url, **engine_kwargs(url))
+        Base.metadata.drop_all(pg)
+
+        print("migraciones:")
+        run_migrations(pg)
+        check(run_migrations(pg) == [], "segunda corrida sin cambios")
+        with pg.begin() as conn:
+            conn.execute(text("ALTER TABLE orders DROP COLUMN updated_at"))
+        applied = run_migrations(pg)
+        check(len(applied) == 1 and "updated_at" in applied[0], f"columna faltante agregada: {applied}")
+
+        print("dbcopy:")
+        seed_orders(args.orders)
+        code = dbcopy.main(["--source", source_url, "--target", url, "--batch", "500", "--truncate"])
+        with Session(pg) as db:
+            copied = db.scalar(select(func.count()).select_from(Order))
+            max_id = db.scalar(select(func.max(Order.id)))
+            db.add(Order(nombre="después de la copia"))
+            db.commit()
+            new_id = db.scalar(select(func.max(Order.id)))
+        check(code == 0 and copied == args.orders, f"{copied}/{args.orders} órdenes copiadas")
+        check(new_id == max_id + 1, f"la secuencia sigue en {new_id} (máximo copiado {max_id})")
+
+        print("statement_timeout:")
+        with pg.connect() as conn:
+            setting = conn.scalar(text("SELECT setting FROM pg_settings WHERE name = 'statement_timeout'"))
+            check(setting == str(args.statement_timeout_ms), f"statement_timeout = {setting} ms")
+            try:
+                conn.execute(text("SELECT pg_sleep(:s)"), {"s": args.statement_timeout_ms / 1000 * 4})
+                cancelled = False
+            except OperationalError as e:
+                cancelled = "statement timeout" in str(e)
+            check(cancelled, "una consulta más lenta se cancela")
+
+        print("réplicas (dos STATE_DIR = dos hosts):")
+        replicas.append(spawn_replica(workdir, url, "a", DB_POOL_SIZE="1", DB_MAX_OVERFLOW="0", DB_POOL_TIMEOUT="5"))
+        replicas.append(spawn_replica(workdir, url, "b"))
+        (_, url_a), (_, url_b) = replicas
+        auth = {"Authorization": f"Bearer {login(url_a, 'admin', 'mtcolectivo123')}"}
+
+        def list_orders(base_url):
+            status, body = Client(base_url, 30).request("GET", "/orders", auth)
+            return json.loads(body) if status == 200 else []
+
+        before = len(list_orders(url_a)), len(list_orders(url_b))   # ambas cachean la lista
+        key = uuid.uuid4().hex
+        payload = json.dumps({"nombre": "Reintento", "personas": "10", "hora_salida": "9:00 am",
+                              "hora_regreso": "5:00 pm", "destino": "Chapala", "fecha": "2026-11-01"}).encode()
+        headers = {"Content-Type": "application/json", "x-api-key": args.api_key, "Idempotency-Key": key}
+
+        def submit(i):
+            status, body = Client(replicas[i % 2][1], 30).request("POST", "/orders/form-submit", headers, payload)
+            return json.loads(body).get("order_id") if status == 200 else None
+
+        with ThreadPoolExecutor(args.retries) as ex:
+            ids = list(ex.map(submit, range(args.retries)))
+        check(len(set(ids)) == 1 and None not in ids, f"{args.retries} reintentos -> órdenes {sorted(set(ids), key=str)}")
+        with Session(pg) as db:
+            created = db.scalar(select(func.count()).select_from(Order).where(Order.nombre == "Reintento"))
+        check(created == 1, f"{created} orden(es) creadas en la base")
+
+        after = len(list_orders(url_a)), len(list_orders(url_b))
+        check(after == (before[0] + 1, before[1] + 1), f"GET /orders en ambas réplicas: {before} -> {after}")
+        order_id = ids[0]
+        Client(url_b, 30).request("POST", f"/orders/{order_id}/toggle-discount", auth)
+        seen = next((o for o in list_orders(url_a) if o["id"] == order_id), {})
+        check((seen.get("descuento") or 0) > 0, "un cambio hecho en b se ve en a")
+
+        # tras una escritura, lecturas concurrentes en a (pool de 1) recargan la lista
+        Client(url_b, 30).request("POST", f"/orders/{order_id}/toggle-discount", auth)
+        with Session(pg) as db:
+            total = db.scalar(select(func.count()).select_from(Order))
+        with ThreadPoolExecutor(16) as ex:
+            counts = list(ex.map(lambda _: len(list_orders(url_a)), range(32)))
+        check(counts == [total] * 32, f"32 GET /orders concurrentes con pool de 1 conexión: {sorted(set(counts))} (esperadas {total})")
+    finally:
+        for proc, _ in replicas:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if server is not None:
+            server.cleanup()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"{len(failures)} verificaciones fallaron")
+        return 1
+    print("OK: PostgreSQL verificado")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
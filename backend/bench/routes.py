@@ -0,0 +1,187 @@
+# bench/routes.py
+"""
+Carga en proceso contra la app ASGI (sin red ni servidor).
+
+Se habla ASGI directamente para no depender de un cliente HTTP y medir sólo
+la app: routing, dependencias, DB, pipeline de render y serialización.
+"""
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+
+from bench.fixtures import SEED, form_payload, make_workbook
+
+
+async def asgi_request(app, method: str, path: str, headers: dict | None = None, body: bytes = b"") -> tuple[int, int]:
+    """Hace una petición ASGI y devuelve (status, bytes del body)."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    status = 0
+    size = 0
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, size
+
+
+def json_body(data) -> tuple[dict, bytes]:
+    return {"content-type": "application/json"}, json.dumps(data).encode()
+
+
+def multipart_body(fields: dict, files: dict) -> tuple[dict, bytes]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode() + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return {"content-type": f"multipart/form-data; boundary={boundary}"}, b"".join(parts)
+
+
+async def load(app, make_request, requests: int, concurrency: int) -> dict:
+    """Lanza `requests` peticiones con `concurrency` en vuelo y resume latencias."""
+    latencies: list[float] = []
+    errors = 0
+    sizes = 0
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors, sizes
+        for i in queue:
+            method, path, headers, body = make_request(i)
+            t0 = time.perf_counter()
+            status, size = await asgi_request(app, method, path, headers, body)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            sizes += size
+            if status >= 400:
+                errors += 1
+
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        "unit": "ms",
+        "requests": requests,
+        "concurrency": concurrency,
+        "rps": requests / elapsed if elapsed else 0.0,
+        "median": statistics.median(latencies),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "errors": errors,
+        "bytes_per_response": sizes / requests if requests else 0,
+        "cpu_ms_per_request": cpu * 1000 / requests if requests else 0,
+    }
+
+
+async def run_async(quick: bool = False) -> dict:
+    from app.auth import create_token
+    from app.main import app
+    from app.routers.orders import FORM_API_KEY
+
+    n = 20 if quick else 200
+    n_pdf = 5 if quick else 40
+    concurrency = 4 if quick else 16
+    auth = {"authorization": "Bearer " + create_token("bench")}
+    rng = random.Random(SEED)
+    workbook = make_workbook()
+
+    def orders_list(_):
+        return "GET", "/orders", auth, b""
+
+    def orders_list_gzip(_):
+        return "GET", "/orders", {**auth, "accept-encoding": "gzip"}, b""
+
+    def orders_list_br(_):
+        return "GET", "/orders", {**auth, "accept-encoding": "br, gzip"}, b""
+
+    def form_submit(_):
+        headers, body = json_body(form_payload(rng))
+        return "POST", "/orders/form-submit", {**headers, "x-api-key": FORM_API_KEY}, body
+
+    def from_data(i):
+        # payload distinto por petición: siempre render completo, nunca el almacén de artefactos
+        headers, body = json_body({"nombre": f"Ana {i}", "subtotal": "5,000.00", "abonado": "1000"})
+        return "POST", "/pdf/from-data", {**auth, **headers}, body
+
+    def from_data_cached(_):
+        headers, body = json_body({"nombre": "Ana 0", "subtotal": "5,000.00", "abonado": "1000"})
+        return "POST", "/pdf/from-data", {**auth, **headers}, body
+
+    def batch(_):
+        headers, body = json_body({"ids": list(range(1, 11))})
+        return "POST", "/pdf/batch", {**auth, **headers}, body
+
+    def from_excel(_):
+        headers, body = multipart_body({"sheet": "Orden"}, {"file": ("orden.xlsx", workbook)})
+        return "POST", "/pdf/from-excel", {**auth, **headers}, body
+
+    routes = {
+        "GET /orders": (orders_list, n),
+        "GET /orders (gzip)": (orders_list_gzip, n),
+        "GET /orders (br)": (orders_list_br, n),
+        "POST /orders/form-submit": (form_submit, n),
+        "POST /pdf/from-data": (from_data, n_pdf),
+        "POST /pdf/from-data (cached)": (from_data_cached, n_pdf),
+        "POST /pdf/batch (10)": (batch, n_pdf),
+        "POST /pdf/from-excel": (from_excel, n_pdf),
+    }
+
+    await app.router.startup()
+    try:
+        results = {}
+        for name, (make_request, count) in routes.items():
+            results[name] = await load(app, make_request, count, concurrency)
+            r = results[name]
+            print(f"  {name:<30} {r['rps']:>8.1f} req/s  p50 {r['median']:>8.2f} ms  p99 {r['p99']:>8.2f} ms  errors {r['errors']}")
+        return results
+    finally:
+        await app.router.shutdown()
+
+
+def run(quick: bool = False) -> dict:
+    return asyncio.run(run_async(quick))
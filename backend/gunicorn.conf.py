@@ -0,0 +1,18 @@
+# gunicorn.conf.py
+# Modo multi-worker: gunicorn -c gunicorn.conf.py app.main:app
+#
+# Las tareas de arranque se serializan con un candado de archivo y las cachés
+# por proceso se invalidan con el contador de generación de app.shared_state,
+# así que varias réplicas pueden compartir la misma base SQLite.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("RENDER_SHUTDOWN_TIMEOUT", "30"))
+accesslog = "-"
+
+# Reparte los procesos de render entre los workers web para no sobresuscribir CPUs
+os.environ.setdefault("RENDER_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))